@@ -1,8 +1,66 @@
 import streamlit as st
-import requests
 import json
-from jose import jwt
+import threading
+import time
 import urllib.parse
+import tracing
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+_jwks_keys = {}
+_jwks_fetched_at = 0.0
+_jwks_lock = threading.Lock()
+
+def _get_auth_base_url():
+    """Returns the Auth0 base URL; AUTH0_BASE_URL can point at a local stub for testing."""
+    return st.secrets.get("AUTH0_BASE_URL", f"https://{st.secrets['AUTH0_DOMAIN']}").rstrip("/")
+
+def _get_http_timeout():
+    """Returns the (connect, read) timeout used for every identity-provider request."""
+    return (float(st.secrets.get("AUTH_CONNECT_TIMEOUT", 3.05)), float(st.secrets.get("AUTH_READ_TIMEOUT", 10)))
+
+def get_http_session():
+    """Returns a process-wide keep-alive HTTP session for talking to Auth0."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(st.secrets.get("AUTH_HTTP_POOL_SIZE", 20)))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"content-type": "application/json"})
+                _http_session = session
+    return _http_session
+
+def _refresh_jwks():
+    """Fetches the JWKS and re-indexes the signing keys by kid. Caller must hold _jwks_lock."""
+    global _jwks_keys, _jwks_fetched_at
+    response = get_http_session().get(f"{_get_auth_base_url()}/.well-known/jwks.json", timeout=_get_http_timeout())
+    response.raise_for_status()
+    _jwks_keys = {
+        key["kid"]: {"kty": key["kty"], "kid": key["kid"], "use": key["use"], "n": key["n"], "e": key["e"]}
+        for key in response.json().get("keys", []) if "kid" in key
+    }
+    _jwks_fetched_at = time.monotonic()
+
+def get_signing_key(kid):
+    """
+    Returns the RSA key for a token's kid from the cached JWKS.
+    The JWKS is re-fetched only when its TTL has expired or the kid is unknown (e.g. after a key rotation),
+    and unknown kids can trigger at most one refresh per JWKS_MIN_REFRESH_SECONDS.
+    """
+    ttl = float(st.secrets.get("JWKS_TTL_SECONDS", 3600))
+    min_refresh = float(st.secrets.get("JWKS_MIN_REFRESH_SECONDS", 30))
+    with _jwks_lock:
+        age = time.monotonic() - _jwks_fetched_at
+        if not _jwks_fetched_at or age > ttl or (kid not in _jwks_keys and age > min_refresh):
+            _refresh_jwks()
+        return _jwks_keys.get(kid)
 
 def show_login_button():
     """Displays the login button and handles the redirect logic."""
@@ -33,17 +91,21 @@ def show_login_button():
         st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
 
+@tracing.traced("process_auth_code")
 def process_auth_code(auth_code):
     """
     Exchanges the authorization code from Auth0 for a user token.
     Returns: A dictionary with user info upon success, None otherwise.
     """
+    import requests
+    from jose import jwt
+
     domain = st.secrets["AUTH0_DOMAIN"]
     client_id = st.secrets["AUTH0_CLIENT_ID"]
     client_secret = st.secrets["AUTH0_CLIENT_SECRET"]
     redirect_uri = "https://docsplain-alpha.streamlit.app"
 
-    token_url = f"https://{domain}/oauth/token"
+    token_url = f"{_get_auth_base_url()}/oauth/token"
     payload = {
         "grant_type": "authorization_code",
         "client_id": client_id,
@@ -51,22 +113,16 @@ def process_auth_code(auth_code):
         "code": auth_code,
         "redirect_uri": redirect_uri,
     }
-    headers = {'content-type': 'application/json'}
     
     try:
-        response = requests.post(token_url, json=payload, headers=headers)
+        response = get_http_session().post(token_url, json=payload, timeout=_get_http_timeout())
         response.raise_for_status()
         token_data = response.json()
         
         id_token = token_data.get('id_token')
         if id_token:
-            jwks_url = f"https://{domain}/.well-known/jwks.json"
-            jwks = requests.get(jwks_url).json()
             unverified_header = jwt.get_unverified_header(id_token)
-            rsa_key = {}
-            for key in jwks["keys"]:
-                if key["kid"] == unverified_header["kid"]:
-                    rsa_key = { "kty": key["kty"], "kid": key["kid"], "use": key["use"], "n": key["n"], "e": key["e"] }
+            rsa_key = get_signing_key(unverified_header["kid"])
             if rsa_key:
                 user_info = jwt.decode(
                     id_token, rsa_key, algorithms=["RS256"],
@@ -0,0 +1,297 @@
+import base64
+import copy
+import json
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from jose import jwt
+
+# Rows per round trip when the fake database reads or writes job rows (database.BULK_PAGE_SIZE).
+BATCH_ROWS = 1000
+_ISSUE_KEY = re.compile(r"^([A-Z]+-\d+)\|", re.MULTILINE)
+
+class FakeSecrets(dict):
+    """Stands in for st.secrets so app modules can be driven outside a Streamlit server."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
+
+class FakeThrottled(Exception):
+    """Quota error shaped like Gemini's 429 ResourceExhausted, with the server's retry hint."""
+
+    code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"429 Resource has been exhausted (e.g. check quota). Please retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+class FakeModel:
+    """
+    Offline stand-in for Gemini. Latency is a fixed time-to-first-token plus a per-output-token delay.
+    Map prompts are answered with one "- [KEY] ..." bullet per item so incremental runs work end to end.
+    With requests_per_window set, calls beyond that many per window_seconds raise FakeThrottled
+    (or with max_concurrent set, calls beyond that many at once), as a quota-limited endpoint would.
+    """
+
+    def __init__(self, first_token_seconds=0.2, seconds_per_token=0.0005, piece_chars=80,
+                 requests_per_window=None, window_seconds=60.0, max_concurrent=None):
+        self.first_token_seconds = first_token_seconds
+        self.seconds_per_token = seconds_per_token
+        self.piece_chars = piece_chars
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self.max_concurrent = max_concurrent
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        """Applies the fake quota, raising FakeThrottled when the call is over it."""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= self.window_seconds:
+                self._recent.popleft()
+            if self.requests_per_window and len(self._recent) >= self.requests_per_window:
+                self.throttled += 1
+                raise FakeThrottled(self.window_seconds - (now - self._recent[0]))
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.throttled += 1
+                raise FakeThrottled(self.first_token_seconds)
+            self._recent.append(now)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _answer(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += len(prompt) // 4
+        keys = _ISSUE_KEY.findall(prompt)
+        if keys:
+            return "\n".join(f"- [{key}] Improved {key.lower()} for OldTerm1 users." for key in keys)
+        headings = [line for line in prompt.splitlines() if line.startswith("### ")]
+        body = "\n".join(f"{heading}\n* Updates to this area, including **OldTerm2** support." for heading in headings)
+        return f"# Release Notes\n\n{body}\n"
+
+    def generate(self, prompt):
+        self._admit()
+        try:
+            answer = self._answer(prompt)
+            time.sleep(self.first_token_seconds + self.seconds_per_token * len(answer) / 4)
+            return answer
+        finally:
+            self._done()
+
+    def stream(self, prompt):
+        self._admit()
+        try:
+            answer = self._answer(prompt)
+            time.sleep(self.first_token_seconds)
+            for start in range(0, len(answer), self.piece_chars):
+                piece = answer[start:start + self.piece_chars]
+                time.sleep(self.seconds_per_token * len(piece) / 4)
+                yield piece
+        finally:
+            self._done()
+
+def _b64_int(value):
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+class FakeAuth0:
+    """
+    Local Auth0 stand-in serving /oauth/token and /.well-known/jwks.json over HTTP.
+    Every exchanged code yields an RS256 id_token for bench-user-<code>@example.com.
+    """
+
+    def __init__(self, domain="bench.auth0.local", client_id="bench-client", latency_seconds=0.05):
+        self.domain = domain
+        self.client_id = client_id
+        self.latency_seconds = latency_seconds
+        self.kid = "bench-key"
+        self.token_requests = 0
+        self.jwks_requests = 0
+        public_key, private_key = rsa.newkeys(2048)
+        self._private_pem = private_key.save_pkcs1().decode("ascii")
+        self._jwks = {"keys": [{
+            "kty": "RSA", "kid": self.kid, "use": "sig", "alg": "RS256",
+            "n": _b64_int(public_key.n), "e": _b64_int(public_key.e),
+        }]}
+        self._server = None
+
+    def _id_token(self, code):
+        now = int(time.time())
+        claims = {
+            "iss": f"https://{self.domain}/", "aud": self.client_id, "sub": f"bench|{code}",
+            "iat": now, "exp": now + 3600,
+            "email": f"bench-user-{code}@example.com", "name": f"Bench User {code}", "picture": "",
+        }
+        return jwt.encode(claims, self._private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, payload):
+                time.sleep(fake.latency_seconds)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                fake.token_requests += 1
+                self._send({"id_token": fake._id_token(request.get("code", "0")), "token_type": "Bearer"})
+
+            def do_GET(self):
+                fake.jwks_requests += 1
+                self._send(fake._jwks)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving on a free local port and returns the base URL."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+class FakeDatabase:
+    """
+    In-memory stand-in for the database.py functions used on the login and generation paths,
+    with a fixed delay per call to model the network round trip.
+    """
+
+    PATCHED = [
+        "setup_database", "get_user_by_email", "create_user_and_organization", "save_kb_for_organization",
+        "get_kb_for_organization", "enqueue_generation_job", "iter_generation_job_rows", "get_job_release_note_rows",
+        "get_release_note_rows", "save_release_note_rows", "save_release_notes",
+    ]
+
+    def __init__(self, latency_seconds=0.002):
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._orgs = {}
+        self._users = {}
+        self._kbs = {}
+        self._job_rows = {}
+        self._row_notes = {}
+        self._release_notes = []
+
+    def _round_trip(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_seconds)
+
+    def setup_database(self):
+        self._round_trip()
+
+    def get_user_by_email(self, email):
+        self._round_trip()
+        user = self._users.get(email.lower())
+        return dict(user) if user else None
+
+    def create_user_and_organization(self, user_info, org_name):
+        self._round_trip()
+        with self._lock:
+            org_id = len(self._orgs) + 1
+            self._orgs[org_id] = org_name
+            user = {
+                "id": len(self._users) + 1, "org_id": org_id, "name": user_info.get("name") or "",
+                "email": user_info.get("email") or "", "picture_url": user_info.get("picture") or "",
+                "org_name": org_name,
+            }
+            self._users[user["email"].lower()] = user
+        return dict(user)
+
+    def save_kb_for_organization(self, org_id, kb_content):
+        self._round_trip()
+        self._kbs[org_id] = copy.deepcopy(kb_content)
+
+    def get_kb_for_organization(self, org_id):
+        self._round_trip()
+        return self._kbs.get(org_id)
+
+    def enqueue_generation_job(self, org_id, user_id, payload, rows=()):
+        """
+        Writes each row as a JSON line to a temporary file, standing in for the job rows table, so
+        queued uploads stay out of the benchmark's traced memory as they would in PostgreSQL.
+        """
+        self._round_trip()
+        rows_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+        with self._lock:
+            job_id = len(self._job_rows) + 1
+            self._job_rows[job_id] = rows_file
+        for count, (source, row_key, record) in enumerate(rows):
+            if count % BATCH_ROWS == 0:
+                self._round_trip()
+            rows_file.write(json.dumps([source, row_key, record], separators=(",", ":"), ensure_ascii=False) + "\n")
+        return job_id
+
+    def _read_job_rows(self, job_id):
+        rows_file = self._job_rows[job_id]
+        rows_file.seek(0)
+        for count, line in enumerate(rows_file):
+            if count and count % BATCH_ROWS == 0:
+                self._round_trip()
+            yield json.loads(line)
+
+    def iter_generation_job_rows(self, job_id, source):
+        self._round_trip()
+        for row_source, _, record in self._read_job_rows(job_id):
+            if row_source == source:
+                yield record
+
+    def get_job_release_note_rows(self, org_id, job_id):
+        self._round_trip()
+        keys = {(source, row_key) for source, row_key, _ in self._read_job_rows(job_id)}
+        return {k[1:]: v for k, v in self._row_notes.items() if k[0] == org_id and k[1:] in keys}
+
+    def get_release_note_rows(self, org_id, row_keys):
+        self._round_trip()
+        keys = set(row_keys)
+        return {k[1:]: v for k, v in self._row_notes.items() if k[0] == org_id and k[2] in keys}
+
+    def save_release_note_rows(self, org_id, notes):
+        self._round_trip()
+        for note in notes:
+            self._row_notes[(org_id, note["source"], note["row_key"])] = {
+                "fingerprint": note["fingerprint"], "category": note["category"], "note": note["note"],
+            }
+
+    def save_release_notes(self, org_id, job_id, content):
+        self._round_trip()
+        self._release_notes.append((org_id, job_id, content))
+
+    def install(self, module):
+        """Replaces the database module's functions with this fake's methods."""
+        for name in self.PATCHED:
+            setattr(module, name, getattr(self, name))
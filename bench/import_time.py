@@ -0,0 +1,63 @@
+"""
+Import-time report for the Streamlit entry point.
+
+Each measurement runs in a fresh interpreter with `python -X importtime`:
+
+    python -m bench.import_time --runs 5
+
+"lazy" imports streamlit_app as it ships (heavy dependencies deferred to first use);
+"eager" imports it and then every module in warmup.HEAVY_MODULES, which is what the app paid
+at cold start when those were imported at module level.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from warmup import HEAVY_MODULES
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(statement):
+    """
+    Runs one statement under -X importtime.
+    Returns: (total seconds, {top-level module: cumulative seconds}).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1e6
+    return sum(top_level.values()), top_level
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per scenario; the median is reported.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list per scenario.")
+    args = parser.parse_args(argv)
+
+    scenarios = {
+        "lazy": "import streamlit_app",
+        "eager": "import streamlit_app; " + "; ".join(f"import {name}" for name in HEAVY_MODULES),
+    }
+    medians = {}
+    for name, statement in scenarios.items():
+        runs = [measure(statement) for _ in range(args.runs)]
+        medians[name] = statistics.median(total for total, _ in runs)
+        slowest = sorted(runs[-1][1].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"\n{name}: {medians[name] * 1000:.0f} ms (median of {args.runs})")
+        for module, seconds in slowest:
+            print(f"  {module:40} {seconds * 1000:8.1f} ms")
+
+    saved = medians["eager"] - medians["lazy"]
+    print(f"\nDeferred at cold start: {saved * 1000:.0f} ms ({saved / medians['eager']:.0%} of the eager import time)")
+
+if __name__ == "__main__":
+    main()
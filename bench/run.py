@@ -0,0 +1,236 @@
+"""
+Offline benchmark for the login and release-note generation paths.
+
+Gemini, Auth0 and PostgreSQL are replaced by local fakes with configurable latency (see bench/fakes.py),
+so this runs on a CI box without network access:
+
+    python -m bench.run --rows 100,10000,100000 --sessions 8
+    python -m bench.run --rows 1000000 --sessions 1 --json results.json
+    python -m bench.run --sessions 16 --model-quota 30 --model-quota-window 5 --rate-limit-rpm 360
+
+Reports per-stage and end-to-end latency, peak traced memory for one session, and throughput
+of concurrent sessions for every row count. With --model-quota the fake model throttles like a
+quota-limited endpoint; --rate-limit-rpm routes calls through rate_limit.RateLimiter to compare.
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import streamlit as st
+
+from bench.fakes import FakeAuth0, FakeDatabase, FakeModel, FakeSecrets
+from prompt_builder import estimate_tokens
+from rate_limit import RateLimiter, PRIORITY_HIGH
+from warmup import HEAVY_MODULES
+from bench.synthetic import make_kb, write_exports
+
+# Imported before measuring so the first row count's peak memory does not include import costs.
+APP_MODULES = ["auth", "database", "generation", "utils", "classification", "terminology", "prompt_builder"]
+
+class StageTimer:
+    """Collects raw per-stage durations across threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.samples.setdefault(name, []).append(elapsed)
+
+    def summary(self):
+        result = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            result[name] = {
+                "count": len(ordered),
+                "p50_ms": 1000 * statistics.median(ordered),
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                "max_ms": 1000 * ordered[-1],
+            }
+        return result
+
+def model_functions(model, limiter):
+    """Returns (model_fn, stream_fn) for the fake model, admitted through the limiter when there is one."""
+    if limiter is None:
+        return model.generate, model.stream
+    return (
+        lambda prompt: limiter.call(lambda: model.generate(prompt), estimate_tokens(prompt)),
+        lambda prompt: limiter.stream(lambda: model.stream(prompt), estimate_tokens(prompt), PRIORITY_HIGH),
+    )
+
+def run_session(session_id, paths, timer, model, args, limiter=None):
+    """
+    One simulated user: log in through the Auth0 stub, queue the uploads as the app does, then
+    generate from the queued rows and render release notes.
+    Returns: False if generation failed (e.g. the model kept throttling), else True.
+    """
+    import auth
+    import database as db
+    from generation import generate_release_notes
+    from utils import iter_upload_records, render_docx
+
+    with timer.stage("end_to_end"):
+        with timer.stage("login.process_auth_code"):
+            user_info = auth.process_auth_code(str(session_id))
+        with timer.stage("login.get_user_by_email"):
+            user = db.get_user_by_email(user_info["email"]) or db.create_user_and_organization(user_info, "Bench Org")
+        if db.get_kb_for_organization(user["org_id"]) is None:
+            db.save_kb_for_organization(user["org_id"], args.kb)
+
+        with timer.stage("db.get_kb_for_organization"):
+            kb = db.get_kb_for_organization(user["org_id"])
+        with timer.stage("parse_csv"):
+            files = {source: open(path, "rb") for source, path in paths.items()}
+            try:
+                job_id = db.enqueue_generation_job(user["org_id"], user["id"], {"sources": list(files)}, iter_upload_records(files))
+            finally:
+                for f in files.values():
+                    f.close()
+        model_fn, stream_fn = model_functions(model, limiter)
+        try:
+            with timer.stage("generate"):
+                notes = generate_release_notes(
+                    kb, {source: db.iter_generation_job_rows(job_id, source) for source in paths},
+                    model_fn=model_fn, stream_fn=stream_fn,
+                    max_workers=args.max_workers, max_chunk_tokens=args.chunk_tokens,
+                    prior_notes=db.get_job_release_note_rows(user["org_id"], job_id) if args.incremental else None,
+                )
+        except Exception:
+            return False
+        # The uncached renderer: every session renders the same notes, so the app's cache would answer all but one.
+        with timer.stage("generate_docx"):
+            render_docx(f"{user['org_name']} Release Notes", notes)
+    return True
+
+def warm_imports():
+    for name in APP_MODULES + HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+
+def run_size(rows, args, workdir):
+    """Benchmarks one row count: a traced single session for memory, then concurrent sessions."""
+    paths = write_exports(os.path.join(workdir, str(rows)), rows, args.kb)
+    model = FakeModel(
+        args.model_first_token, args.model_seconds_per_token, requests_per_window=args.model_quota,
+        window_seconds=args.model_quota_window, max_concurrent=args.model_max_concurrent,
+    )
+    limiter = RateLimiter(
+        requests_per_minute=args.rate_limit_rpm, tokens_per_minute=args.rate_limit_tpm,
+        max_concurrency=args.rate_limit_max_concurrency, base_backoff_seconds=0.25,
+    ) if args.rate_limit_rpm else None
+
+    memory_timer = StageTimer()
+    tracemalloc.start()
+    run_session(0, paths, memory_timer, model, args, limiter)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        succeeded = list(pool.map(lambda i: run_session(i + 1, paths, timer, model, args, limiter), range(args.sessions)))
+    wall = time.perf_counter() - started
+
+    return {
+        "rows": rows,
+        "peak_memory_mb": peak / 2**20,
+        "sessions": args.sessions,
+        "wall_seconds": wall,
+        "sessions_per_second": args.sessions / wall if wall else 0.0,
+        "model_calls": model.calls,
+        "model_prompt_tokens": model.prompt_tokens,
+        "model_throttled": model.throttled,
+        "model_peak_in_flight": model.peak_in_flight,
+        "failed_sessions": succeeded.count(False),
+        "rate_limiter": limiter.stats() if limiter else None,
+        "stages": timer.summary(),
+    }
+
+def print_report(results):
+    for result in results:
+        print(f"\n== {result['rows']:,} rows: {result['sessions']} sessions in {result['wall_seconds']:.2f}s "
+              f"({result['sessions_per_second']:.2f}/s), peak memory {result['peak_memory_mb']:.1f} MiB, "
+              f"{result['model_calls']} model calls, ~{result['model_prompt_tokens']:,} prompt tokens")
+        print(f"   {result['model_throttled']} throttled, peak {result['model_peak_in_flight']} in flight, "
+              f"{result['failed_sessions']} failed sessions")
+        if result["rate_limiter"]:
+            limiter = result["rate_limiter"]
+            print(f"   limiter: {limiter['admitted']} admitted, {limiter['retries']} retries, "
+                  f"wait avg {limiter['wait_seconds_avg'] * 1000:.0f} ms / max {limiter['wait_seconds_max'] * 1000:.0f} ms, "
+                  f"concurrency limit {limiter['concurrency_limit']}")
+        print(f"{'stage':32} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for name, stats in sorted(result["stages"].items()):
+            print(f"{name:32} {stats['count']:>6} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} {stats['max_ms']:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100,10000", help="Comma-separated total row counts to benchmark.")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent simulated user sessions.")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--keywords", type=int, default=25, help="Keywords per category.")
+    parser.add_argument("--terms", type=int, default=500, help="Terminology rules in the KB.")
+    parser.add_argument("--model-first-token", type=float, default=0.2, help="Fake model time-to-first-token (s).")
+    parser.add_argument("--model-seconds-per-token", type=float, default=0.0005)
+    parser.add_argument("--model-quota", type=int, help="Fake model calls allowed per quota window; more are throttled.")
+    parser.add_argument("--model-quota-window", type=float, default=60.0, help="Fake model quota window (s).")
+    parser.add_argument("--model-max-concurrent", type=int, help="Fake model calls allowed at once; more are throttled.")
+    parser.add_argument("--rate-limit-rpm", type=float, help="Route model calls through RateLimiter at this many requests/min.")
+    parser.add_argument("--rate-limit-tpm", type=float, default=1_000_000, help="RateLimiter tokens/min.")
+    parser.add_argument("--rate-limit-max-concurrency", type=int, default=8)
+    parser.add_argument("--auth-latency", type=float, default=0.05, help="Auth0 stub latency per request (s).")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Fake database round trip (s).")
+    parser.add_argument("--database-url", help="Use a local PostgreSQL through database.py instead of the fake.")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--chunk-tokens", type=int, default=6000)
+    parser.add_argument("--incremental", action="store_true", help="Run generation in incremental mode.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+    args.kb = make_kb(args.categories, args.keywords, args.terms)
+
+    auth0 = FakeAuth0(latency_seconds=args.auth_latency)
+    base_url = auth0.start()
+    secrets = FakeSecrets(
+        AUTH0_DOMAIN=auth0.domain, AUTH0_CLIENT_ID=auth0.client_id, AUTH0_CLIENT_SECRET="bench-secret",
+        AUTH0_BASE_URL=base_url, GEMINI_API_KEY="offline", AI_CACHE_ENABLED=False,
+    )
+    if args.database_url:
+        secrets.update(DATABASE_URL=args.database_url, KB_CACHE_LISTEN=False)
+    st.secrets = secrets
+
+    import database as db
+    if args.database_url:
+        db.setup_database()
+    else:
+        FakeDatabase(args.db_latency).install(db)
+
+    warm_imports()
+    try:
+        with tempfile.TemporaryDirectory(prefix="docsplain-bench-") as workdir:
+            results = [run_size(int(rows), args, workdir) for rows in args.rows.split(",") if rows.strip()]
+    finally:
+        auth0.stop()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
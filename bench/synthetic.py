@@ -0,0 +1,86 @@
+import csv
+import os
+import random
+
+# Columns the app reads, followed by the kind of unused columns a real Jira export carries.
+USED_COLUMNS = [
+    "Issue key", "Issue Type", "Summary", "Description", "Status", "Priority", "Resolution",
+    "Component/s", "Labels", "Labels", "Fix Version/s", "Epic Link",
+]
+UNUSED_COLUMNS = [
+    "Issue id", "Project key", "Project name", "Reporter", "Assignee", "Creator", "Created", "Updated",
+    "Resolved", "Due date", "Sprint", "Custom field (Story Points)", "Custom field (Team)",
+    "Custom field (Rank)", "Watchers", "Votes", "Environment", "Original Estimate", "Time Spent",
+    "Attachment", "Comment", "Comment", "Comment", "Security Level", "Log Work",
+]
+SOURCES = {
+    "epics": ["Epic"],
+    "stories": ["Story", "Story", "Task", "Improvement", "Sub-task"],
+    "fixes": ["Bug"],
+}
+WORDS = (
+    "account billing cache checkout dashboard export filter import latency login mobile onboarding "
+    "payment permission report search session settings sync upload webhook workflow"
+).split()
+
+def make_kb(categories=20, keywords_per_category=25, terms=500, seed=0):
+    """Builds a knowledge base with the given number of product categories, keywords and terminology rules."""
+    rng = random.Random(seed)
+    product_categories = {}
+    for c in range(categories):
+        keywords = [f"kw{c}x{k}" for k in range(keywords_per_category)]
+        keywords.append(rng.choice(WORDS) + f" {c}")
+        product_categories[f"Category {c}"] = {
+            "description": f"Changes to product area {c}.",
+            "keywords_and_aliases": keywords,
+        }
+    return {
+        "company_name": "Benchmark Corp",
+        "product_categories": product_categories,
+        "writing_style_guide": {
+            "professional_tone_rule": "Adopt a neutral, professional tone. State facts directly.",
+            "terminology_rules": {f"OldTerm{t}": f"New Term {t}" for t in range(terms)},
+        },
+    }
+
+def _row(rng, key, issue_type, kb_keywords, terms):
+    words = " ".join(rng.choice(WORDS) for _ in range(6))
+    keyword = rng.choice(kb_keywords) if kb_keywords and rng.random() < 0.7 else ""
+    term = f"OldTerm{rng.randrange(terms)}" if terms and rng.random() < 0.3 else ""
+    used = [
+        key, issue_type, f"{words} {keyword} {term}".strip(),
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))),
+        rng.choice(["Done", "Done", "Closed", "In Review"]),
+        rng.choice(["Highest", "High", "Medium", "Medium", "Low"]),
+        rng.choice(["Done", "Fixed", ""]),
+        rng.choice(["", "API", "Web", "Mobile"]),
+        rng.choice(["", "customer-facing", "internal"]), rng.choice(["", "q3"]),
+        "1.0.0", f"EPIC-{rng.randint(1, 50)}",
+    ]
+    unused = [str(rng.randint(1, 10**6)) if i % 3 else "" for i in range(len(UNUSED_COLUMNS))]
+    return used + unused
+
+def write_csv(path, source, rows, kb=None, seed=0):
+    """Streams a synthetic Jira export for one source ("epics", "stories", "fixes") to disk."""
+    rng = random.Random(f"{seed}-{source}")
+    prefix = {"epics": "EPIC", "stories": "STORY", "fixes": "BUG"}[source]
+    kb_keywords = [k for c in (kb or {}).get("product_categories", {}).values() for k in c["keywords_and_aliases"]]
+    terms = len(((kb or {}).get("writing_style_guide") or {}).get("terminology_rules") or {})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(USED_COLUMNS + UNUSED_COLUMNS)
+        for i in range(rows):
+            writer.writerow(_row(rng, f"{prefix}-{i + 1}", rng.choice(SOURCES[source]), kb_keywords, terms))
+    return path
+
+def write_exports(directory, rows, kb=None, seed=0):
+    """
+    Writes epics, stories and fixes CSVs totalling roughly `rows` rows (10% / 70% / 20%).
+    Returns: A dict of source key -> file path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    split = {"epics": max(rows // 10, 1), "stories": max(rows * 7 // 10, 1), "fixes": max(rows // 5, 1)}
+    return {
+        source: write_csv(os.path.join(directory, f"{source}-{rows}.csv"), source, count, kb, seed)
+        for source, count in split.items()
+    }
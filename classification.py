@@ -0,0 +1,82 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from text_matching import build_terms_pattern
+
+# Row fields scanned for category keywords, in the order they are concatenated.
+CLASSIFY_COLUMNS = ["Summary", "Component/s", "Labels", "Epic Name", "Parent summary", "Description"]
+CLASSIFY_BATCH_ROWS = 5000
+_CLASSIFIER_CACHE_SIZE = 32
+
+_classifiers = OrderedDict()
+_classifiers_lock = threading.Lock()
+
+class KeywordClassifier:
+    """Assigns rows to KB product categories by matching category names and keywords_and_aliases."""
+
+    def __init__(self, product_categories):
+        self.categories = list(product_categories)
+        self._keyword_categories = {}
+        for position, (name, details) in enumerate(product_categories.items()):
+            keywords = [name] + list((details or {}).get("keywords_and_aliases") or [])
+            for keyword in keywords:
+                keyword = str(keyword).strip().lower()
+                if keyword:
+                    self._keyword_categories.setdefault(keyword, []).append(position)
+        self.pattern = build_terms_pattern(self._keyword_categories)
+
+    def classify(self, rows):
+        """
+        Returns the best category name for each row, or None when no keyword matched.
+        The category with the most keyword hits wins; ties go to the category defined first in the KB.
+        """
+        import pandas as pd
+
+        rows = list(rows)
+        if not rows or self.pattern is None:
+            return [None] * len(rows)
+        frame = pd.DataFrame.from_records(rows)
+        columns = [c for c in CLASSIFY_COLUMNS if c in frame.columns]
+        if not columns:
+            return [None] * len(rows)
+        frame = frame[columns].fillna("").astype(str)
+        text = frame[columns[0]].str.cat([frame[c] for c in columns[1:]], sep=" ")
+        matches = text.str.findall(self.pattern).explode().dropna().str.lower()
+        if matches.empty:
+            return [None] * len(rows)
+        hits = matches.map(self._keyword_categories).explode()
+        counts = hits.groupby([hits.index, hits.values]).size().reset_index()
+        counts.columns = ["row", "category", "hits"]
+        best = counts.sort_values(["row", "hits", "category"], ascending=[True, False, True]).drop_duplicates("row")
+        winners = pd.Series(best["category"].map(lambda position: self.categories[position]).values, index=best["row"].values)
+        # Built explicitly: depending on the pandas version, reindexed gaps come back as NaN rather than None.
+        return [None if pd.isna(category) else category for category in winners.reindex(range(len(rows)))]
+
+def get_classifier(kb):
+    """Returns a compiled classifier for a KB, reusing it for as long as the KB's categories are unchanged."""
+    categories = (kb or {}).get("product_categories") or {}
+    version = hashlib.sha1(json.dumps(categories, sort_keys=True).encode("utf-8")).hexdigest()
+    with _classifiers_lock:
+        classifier = _classifiers.get(version)
+        if classifier is not None:
+            _classifiers.move_to_end(version)
+            return classifier
+    classifier = KeywordClassifier(categories)
+    with _classifiers_lock:
+        _classifiers[version] = classifier
+        while len(_classifiers) > _CLASSIFIER_CACHE_SIZE:
+            _classifiers.popitem(last=False)
+    return classifier
+
+def iter_classified(rows, classifier, batch_rows=CLASSIFY_BATCH_ROWS):
+    """Yields (row, category) pairs, classifying a streamed iterable of rows one batch at a time."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            yield from zip(batch, classifier.classify(batch))
+            batch = []
+    if batch:
+        yield from zip(batch, classifier.classify(batch))
@@ -1,63 +1,173 @@
 import streamlit as st
 import psycopg2
+import psycopg2.pool
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+import itertools
 import json
+import threading
+import time
+from contextlib import contextmanager
+import migrations
+import tracing
+from kb_cache import KBCache, KB_CHANGED_CHANNEL, start_invalidation_listener
 
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = None
+_pool_stats = {
+    "checkouts": 0,
+    "in_use": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "timeouts": 0,
+    "discarded": 0,
+}
+_pool_stats_lock = threading.Lock()
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+_kb_cache = None
+_kb_cache_lock = threading.Lock()
+
+# Advisory lock held while bulk provisioning resolves organizations by name, so two imports
+# running at once cannot both create the same organization.
+PROVISIONING_LOCK_KEY = 7_315_004_212
+BULK_PAGE_SIZE = 1000
+
+tracing.register_collector("db_pool", lambda: get_pool_stats() if _pool else {})
+tracing.register_collector("kb_cache", lambda: _kb_cache.stats() if _kb_cache else {})
+
+
+def _get_pool():
+    """Creates the process-wide connection pool on first use and returns it."""
+    global _pool, _pool_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                min_size = int(st.secrets.get("DB_POOL_MIN_SIZE", 1))
+                max_size = int(st.secrets.get("DB_POOL_MAX_SIZE", 10))
+                _pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, st.secrets["DATABASE_URL"])
+                _pool_slots = threading.BoundedSemaphore(max_size)
+    return _pool
+
+
+def _is_healthy(conn):
+    """Checks that a pooled connection is still usable before handing it out."""
+    if conn.closed:
+        return False
+    if not st.secrets.get("DB_POOL_PRE_PING", True):
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    """Takes a healthy connection from the pool, waiting for a free slot if needed."""
+    pool = _get_pool()
+    timeout = float(st.secrets.get("DB_POOL_TIMEOUT", 10))
+    started = time.perf_counter()
+    if not _pool_slots.acquire(timeout=timeout):
+        with _pool_stats_lock:
+            _pool_stats["timeouts"] += 1
+        raise psycopg2.pool.PoolError(f"Timed out after {timeout}s waiting for a database connection.")
+    waited = time.perf_counter() - started
+    try:
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            pool.putconn(conn, close=True)
+            with _pool_stats_lock:
+                _pool_stats["discarded"] += 1
+            conn = pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+    with _pool_stats_lock:
+        _pool_stats["checkouts"] += 1
+        _pool_stats["in_use"] += 1
+        _pool_stats["wait_seconds_total"] += waited
+        _pool_stats["wait_seconds_max"] = max(_pool_stats["wait_seconds_max"], waited)
+    return conn
+
+
+def _checkin(conn):
+    """Returns a connection to the pool, resetting any open transaction first."""
+    close = bool(conn.closed)
+    if not close:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            close = True
+    _pool.putconn(conn, close=close)
+    _pool_slots.release()
+    with _pool_stats_lock:
+        _pool_stats["in_use"] -= 1
+        if close:
+            _pool_stats["discarded"] += 1
+
+
+@contextmanager
 def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
+    """
+    Borrows a connection from the shared PostgreSQL pool for the duration of a `with` block.
+    Yields None (after reporting the error) if no connection could be obtained.
+    """
     try:
-        conn = psycopg2.connect(st.secrets["DATABASE_URL"])
-        return conn
+        conn = _checkout()
     except Exception as e:
         st.error(f"Database Connection Error: Could not connect to the database. Please check your DATABASE_URL secret. Details: {e}")
-        return None
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        _checkin(conn)
+
+
+def get_pool_stats():
+    """Returns a snapshot of connection pool usage for sizing the pool."""
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats["max_size"] = _pool.maxconn if _pool else int(st.secrets.get("DB_POOL_MAX_SIZE", 10))
+    stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    return stats
 
 def setup_database():
-    """Creates the necessary tables in the database if they don't exist."""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS organizations (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(255) NOT NULL
-                    );
-                """)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        org_id INTEGER REFERENCES organizations(id),
-                        name VARCHAR(255),
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        picture_url TEXT
-                    );
-                """)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS knowledge_bases (
-                        id SERIAL PRIMARY KEY,
-                        org_id INTEGER UNIQUE REFERENCES organizations(id),
-                        kb_content JSONB NOT NULL,
-                        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-            conn.commit()
-        except psycopg2.Error as e:
-            st.error(f"Database Schema Error: Could not set up tables. Details: {e}")
-        finally:
-            conn.close()
+    """
+    Brings the schema up to date by applying pending migrations.
+    Runs once per server process; every later call (e.g. on a Streamlit rerun) returns immediately.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with get_db_connection() as conn:
+            if conn:
+                try:
+                    migrations.apply_migrations(conn)
+                    _schema_ready = True
+                except psycopg2.Error as e:
+                    st.error(f"Database Schema Error: Could not set up tables. Details: {e}")
 
+@tracing.traced("db.get_user_by_email")
 def get_user_by_email(email):
-    """Retrieves a user and their organization from the database by email."""
-    conn = get_db_connection()
-    if conn:
-        try:
+    """Retrieves a user and their organization from the database by email, ignoring case."""
+    with get_db_connection() as conn:
+        if conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT u.id, u.org_id, u.name, u.email, u.picture_url, o.name as org_name
                     FROM users u
                     JOIN organizations o ON u.org_id = o.id
-                    WHERE u.email = %s;
+                    WHERE lower(u.email) = lower(%s);
                 """, (email,))
                 user_data = cur.fetchone()
                 if user_data:
@@ -73,78 +183,433 @@ def get_user_by_email(email):
                         "org_name": str(db_dict.get("org_name") or "")
                     }
                     return sanitized_user
-        finally:
-            conn.close()
     return None
 
 def create_user_and_organization(user_info, org_name):
     """Creates a new organization and a new user, then returns the new user's sanitized data."""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                # --- FIX: Rewritten to be atomic and avoid race conditions ---
-                # 1. Create the organization and get its ID
-                cur.execute("INSERT INTO organizations (name) VALUES (%s) RETURNING id;", (org_name,))
-                org_id = cur.fetchone()[0]
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    # --- FIX: Rewritten to be atomic and avoid race conditions ---
+                    # 1. Create the organization and get its ID
+                    cur.execute("INSERT INTO organizations (name) VALUES (%s) RETURNING id;", (org_name,))
+                    org_id = cur.fetchone()[0]
 
-                # 2. Create the user and get their ID
-                cur.execute("""
-                    INSERT INTO users (org_id, name, email, picture_url)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id;
-                """, (org_id, user_info.get('name'), user_info.get('email'), user_info.get('picture')))
-                user_id = cur.fetchone()[0]
+                    # 2. Create the user and get their ID
+                    cur.execute("""
+                        INSERT INTO users (org_id, name, email, picture_url)
+                        VALUES (%s, %s, %s, %s)
+                        RETURNING id;
+                    """, (org_id, user_info.get('name'), user_info.get('email'), user_info.get('picture')))
+                    user_id = cur.fetchone()[0]
                 
-                conn.commit()
+                    conn.commit()
 
-                # 3. Construct and return a sanitized user object directly
-                # This avoids a second database call and prevents the race condition.
-                new_user = {
-                    "id": int(user_id),
-                    "org_id": int(org_id),
-                    "name": str(user_info.get("name") or ""),
-                    "email": str(user_info.get("email") or ""),
-                    "picture_url": str(user_info.get("picture") or ""),
-                    "org_name": str(org_name or "")
-                }
-                return new_user
-                # --- END FIX ---
+                    # 3. Construct and return a sanitized user object directly
+                    # This avoids a second database call and prevents the race condition.
+                    new_user = {
+                        "id": int(user_id),
+                        "org_id": int(org_id),
+                        "name": str(user_info.get("name") or ""),
+                        "email": str(user_info.get("email") or ""),
+                        "picture_url": str(user_info.get("picture") or ""),
+                        "org_name": str(org_name or "")
+                    }
+                    return new_user
+                    # --- END FIX ---
 
-        except psycopg2.Error as e:
-            st.error(f"Error during user registration: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            except psycopg2.Error as e:
+                st.error(f"Error during user registration: {e}")
+                conn.rollback()
     return None
 
 
+def _get_kb_cache():
+    """Creates the shared knowledge-base cache (and its invalidation listener) on first use."""
+    global _kb_cache
+    if _kb_cache is None:
+        with _kb_cache_lock:
+            if _kb_cache is None:
+                cache = KBCache(
+                    max_entries=int(st.secrets.get("KB_CACHE_MAX_ENTRIES", 256)),
+                    ttl_seconds=float(st.secrets.get("KB_CACHE_TTL_SECONDS", 300)),
+                )
+                if st.secrets.get("KB_CACHE_LISTEN", True):
+                    start_invalidation_listener(st.secrets["DATABASE_URL"], cache)
+                _kb_cache = cache
+    return _kb_cache
+
+def get_kb_cache_stats():
+    """Returns hit/miss counters for the knowledge-base cache."""
+    return _get_kb_cache().stats()
+
 def save_kb_for_organization(org_id, kb_content):
-    """Saves or updates the knowledge base for a given organization."""
-    conn = get_db_connection()
-    if conn:
-        try:
+    """Saves or updates the knowledge base for a given organization and notifies every replica's cache."""
+    cache = _get_kb_cache()
+    cache.invalidate(org_id)
+    with get_db_connection() as conn:
+        if conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO knowledge_bases (org_id, kb_content)
                     VALUES (%s, %s)
                     ON CONFLICT (org_id) DO UPDATE SET
-                        kb_content = EXCLUDED.kb_content;
+                        kb_content = EXCLUDED.kb_content,
+                        version = knowledge_bases.version + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                    RETURNING version;
                 """, (org_id, json.dumps(kb_content)))
+                version = cur.fetchone()[0]
+                cur.execute("SELECT pg_notify(%s, %s);", (KB_CHANGED_CHANNEL, str(org_id)))
                 conn.commit()
-        finally:
-            conn.close()
+            cache.put(org_id, version, kb_content)
 
+@tracing.traced("db.get_kb_for_organization")
 def get_kb_for_organization(org_id):
-    """Retrieves the knowledge base content for a given organization."""
-    conn = get_db_connection()
-    if conn:
-        try:
+    """Retrieves the knowledge base content for a given organization, serving repeat reads from the cache."""
+    cache = _get_kb_cache()
+    cached = cache.get(org_id)
+    if cached is not None:
+        return cached[1]
+    with get_db_connection() as conn:
+        if conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT kb_content FROM knowledge_bases WHERE org_id = %s;", (org_id,))
+                cur.execute("SELECT kb_content, version FROM knowledge_bases WHERE org_id = %s;", (org_id,))
                 kb_data = cur.fetchone()
                 if kb_data:
+                    cache.put(org_id, kb_data[1], kb_data[0])
                     return kb_data[0]
-        finally:
-            conn.close()
+    return None
+
+_JOB_COLUMNS = """
+    id, org_id, user_id, status, progress, progress_message, result, error, attempts,
+    created_at, started_at, finished_at
+"""
+
+def _job_from_row(cur, row):
+    """Turns a generation_jobs row into a plain dictionary (payload excluded)."""
+    if not row:
+        return None
+    job = dict(zip([desc[0] for desc in cur.description], row))
+    job["progress"] = float(job["progress"] or 0)
+    return job
+
+def enqueue_generation_job(org_id, user_id, payload, rows=()):
+    """
+    Queues a release-notes generation job and returns its id. payload is a dict or already-encoded JSON text.
+    rows is an iterable of (source, row_key, record) tuples written to generation_job_rows BULK_PAGE_SIZE at a
+    time as it is consumed, in the same transaction as the job, so workers never see a job without its rows.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO generation_jobs (org_id, user_id, payload)
+                    VALUES (%s, %s, %s)
+                    RETURNING id;
+                """, (org_id, user_id, payload if isinstance(payload, str) else json.dumps(payload)))
+                job_id = cur.fetchone()[0]
+                rows, positions = iter(rows), itertools.count()
+                for batch in iter(lambda: list(itertools.islice(rows, BULK_PAGE_SIZE)), []):
+                    execute_values(cur, """
+                        INSERT INTO generation_job_rows (job_id, position, source, row_key, record) VALUES %s;
+                    """, [
+                        (job_id, next(positions), source, row_key, json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+                        for source, row_key, record in batch
+                    ], template="(%s, %s, %s, %s, %s::jsonb)", page_size=BULK_PAGE_SIZE)
+                conn.commit()
+                return job_id
+    return None
+
+def iter_generation_job_rows(job_id, source):
+    """
+    Streams a job's records for one source in upload order through a server-side cursor that fetches
+    BULK_PAGE_SIZE rows at a time. A pooled connection is held until the iteration ends.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor(name=f"generation_job_rows_{job_id}") as cur:
+                cur.itersize = BULK_PAGE_SIZE
+                cur.execute("""
+                    SELECT record FROM generation_job_rows
+                    WHERE job_id = %s AND source = %s
+                    ORDER BY position;
+                """, (job_id, source))
+                for (record,) in cur:
+                    yield record
+
+def claim_generation_job(worker_id):
+    """
+    Atomically claims the oldest queued job for a worker. SKIP LOCKED lets any number of workers
+    across replicas poll the same table without blocking on, or double-claiming, each other's jobs.
+    Returns: The job dictionary including its payload, or None if the queue is empty.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    UPDATE generation_jobs
+                    SET status = 'running', worker_id = %s, attempts = attempts + 1,
+                        started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM generation_jobs
+                        WHERE status = 'queued'
+                        ORDER BY created_at
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING {_JOB_COLUMNS}, payload;
+                """, (worker_id,))
+                job = _job_from_row(cur, cur.fetchone())
+                conn.commit()
+                return job
+    return None
+
+def heartbeat_generation_job(job_id, worker_id):
+    """
+    Refreshes a running job's heartbeat so the stale-job sweep leaves it with this worker.
+    Returns: False if the job is no longer running on this worker (it was requeued or finished), else True.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE generation_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND worker_id = %s AND status = 'running';
+                """, (job_id, worker_id))
+                owned = cur.rowcount > 0
+                conn.commit()
+                return owned
+    return True
+
+def update_generation_job_progress(job_id, worker_id, progress, message=None, partial_result=None):
+    """
+    Records a running job's progress (0-1), status message and partial output, and refreshes its heartbeat.
+    Only the worker that currently holds the job can update it. Returns: True if the update applied.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE generation_jobs
+                    SET progress = %s, progress_message = COALESCE(%s, progress_message),
+                        result = COALESCE(%s, result), heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND worker_id = %s AND status = 'running';
+                """, (progress, message, partial_result, job_id, worker_id))
+                updated = cur.rowcount > 0
+                conn.commit()
+                return updated
+    return False
+
+def finish_generation_job(job_id, worker_id, result=None, error=None):
+    """
+    Marks a job as succeeded with its result, or as failed with an error message, if the worker still holds it.
+    Returns: True if the job was finished by this call.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE generation_jobs
+                    SET status = %s, progress = CASE WHEN %s IS NULL THEN 1 ELSE progress END,
+                        result = COALESCE(%s, result), error = %s, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND worker_id = %s AND status = 'running';
+                """, ("failed" if error else "succeeded", error, result, error, job_id, worker_id))
+                finished = cur.rowcount > 0
+                if finished:
+                    cur.execute("DELETE FROM generation_job_rows WHERE job_id = %s;", (job_id,))
+                conn.commit()
+                return finished
+    return False
+
+def requeue_stale_generation_jobs(stale_seconds, max_attempts):
+    """
+    Returns running jobs whose worker stopped heartbeating to the queue, or fails them once they
+    have used up max_attempts. Returns: The number of jobs touched.
+    """
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE generation_jobs
+                    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                        error = CASE WHEN attempts >= %s THEN 'Worker stopped responding.' ELSE error END,
+                        finished_at = CASE WHEN attempts >= %s THEN CURRENT_TIMESTAMP ELSE NULL END,
+                        worker_id = NULL
+                    WHERE status = 'running'
+                      AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    RETURNING id, status;
+                """, (max_attempts, max_attempts, max_attempts, stale_seconds))
+                touched = cur.fetchall()
+                failed = [job_id for job_id, status in touched if status == "failed"]
+                if failed:
+                    cur.execute("DELETE FROM generation_job_rows WHERE job_id = ANY(%s);", (failed,))
+                conn.commit()
+                return len(touched)
+    return 0
+
+def get_generation_job(job_id):
+    """Retrieves a job's status, progress and result."""
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {_JOB_COLUMNS} FROM generation_jobs WHERE id = %s;", (job_id,))
+                return _job_from_row(cur, cur.fetchone())
+    return None
+
+def get_latest_generation_job(user_id):
+    """Retrieves a user's most recent job, so a reconnecting browser can pick up where it left off."""
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT {_JOB_COLUMNS} FROM generation_jobs
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT 1;
+                """, (user_id,))
+                return _job_from_row(cur, cur.fetchone())
+    return None
+
+def get_release_note_rows(org_id, row_keys):
+    """Retrieves saved per-row notes for an organization, keyed by (source, row_key)."""
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT source, row_key, fingerprint, category, note
+                    FROM release_note_rows
+                    WHERE org_id = %s AND row_key = ANY(%s);
+                """, (org_id, list(row_keys)))
+                return {
+                    (source, row_key): {"fingerprint": fingerprint, "category": category, "note": note}
+                    for source, row_key, fingerprint, category, note in cur.fetchall()
+                }
+    return {}
+
+def get_job_release_note_rows(org_id, job_id):
+    """Retrieves the saved per-row notes for the rows of a queued job, keyed by (source, row_key)."""
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT n.source, n.row_key, n.fingerprint, n.category, n.note
+                    FROM release_note_rows n
+                    WHERE n.org_id = %s AND (n.source, n.row_key) IN (
+                        SELECT source, row_key FROM generation_job_rows WHERE job_id = %s
+                    );
+                """, (org_id, job_id))
+                return {
+                    (source, row_key): {"fingerprint": fingerprint, "category": category, "note": note}
+                    for source, row_key, fingerprint, category, note in cur.fetchall()
+                }
+    return {}
+
+def save_release_note_rows(org_id, notes):
+    """Upserts the per-row notes written during a generation in one batched statement."""
+    if not notes:
+        return
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO release_note_rows (org_id, source, row_key, fingerprint, category, note)
+                    VALUES %s
+                    ON CONFLICT (org_id, source, row_key) DO UPDATE SET
+                        fingerprint = EXCLUDED.fingerprint,
+                        category = EXCLUDED.category,
+                        note = EXCLUDED.note,
+                        updated_at = CURRENT_TIMESTAMP;
+                """, [
+                    (org_id, n["source"], n["row_key"], n["fingerprint"], n["category"], n["note"]) for n in notes
+                ])
+                conn.commit()
+
+def save_release_notes(org_id, job_id, content):
+    """Saves a finished release-notes document for an organization."""
+    with get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO release_notes (org_id, job_id, content) VALUES (%s, %s, %s);",
+                    (org_id, job_id, content)
+                )
+                conn.commit()
+
+def bulk_provision(org_names, users, knowledge_bases):
+    """
+    Provisions organizations, users and knowledge bases in one transaction with batched upserts.
+    Organizations are matched by name (the oldest one wins if a name is repeated) and created if missing.
+    Users are upserted on email, ignoring case; knowledge bases replace the organization's current one and bump its version.
+    Args:
+        org_names: Organization names to resolve or create.
+        users: Dicts with email, name, picture_url and org_name.
+        knowledge_bases: A dict of organization name -> KB content.
+    Returns: Counts of what was written, or None if the transaction failed.
+    """
+    cache = _get_kb_cache()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s);", (PROVISIONING_LOCK_KEY,))
+                    names = list(dict.fromkeys(org_names))
+                    cur.execute("""
+                        SELECT DISTINCT ON (name) name, id FROM organizations
+                        WHERE name = ANY(%s)
+                        ORDER BY name, id;
+                    """, (names,))
+                    org_ids = dict(cur.fetchall())
+                    missing = [(name,) for name in names if name not in org_ids]
+                    created = execute_values(
+                        cur, "INSERT INTO organizations (name) VALUES %s RETURNING name, id;",
+                        missing, page_size=BULK_PAGE_SIZE, fetch=True,
+                    ) if missing else []
+                    org_ids.update(created)
+
+                    if users:
+                        execute_values(cur, """
+                            INSERT INTO users (org_id, name, email, picture_url)
+                            VALUES %s
+                            ON CONFLICT (lower(email)) DO UPDATE SET
+                                org_id = EXCLUDED.org_id,
+                                name = COALESCE(NULLIF(EXCLUDED.name, ''), users.name),
+                                picture_url = COALESCE(NULLIF(EXCLUDED.picture_url, ''), users.picture_url);
+                        """, [
+                            (org_ids[u["org_name"]], u["name"], u["email"], u["picture_url"]) for u in users
+                        ], page_size=BULK_PAGE_SIZE)
+
+                    versions = []
+                    if knowledge_bases:
+                        versions = execute_values(cur, """
+                            INSERT INTO knowledge_bases (org_id, kb_content)
+                            VALUES %s
+                            ON CONFLICT (org_id) DO UPDATE SET
+                                kb_content = EXCLUDED.kb_content,
+                                version = knowledge_bases.version + 1,
+                                updated_at = CURRENT_TIMESTAMP
+                            RETURNING org_id, version;
+                        """, [
+                            (org_ids[name], json.dumps(kb)) for name, kb in knowledge_bases.items()
+                        ], template="(%s, %s::jsonb)", page_size=BULK_PAGE_SIZE, fetch=True)
+                        cur.execute(
+                            "SELECT pg_notify(%s, org_id::text) FROM unnest(%s::int[]) AS org_id;",
+                            (KB_CHANGED_CHANNEL, [org_id for org_id, _ in versions])
+                        )
+                    conn.commit()
+            except psycopg2.Error as e:
+                st.error(f"Error during bulk provisioning: {e}")
+                conn.rollback()
+                return None
+
+            # Invalidate rather than fill: a large import would otherwise evict the working set.
+            for org_id, _ in versions:
+                cache.invalidate(org_id)
+            return {
+                "organizations_created": len(created),
+                "organizations_matched": len(names) - len(created),
+                "users_upserted": len(users),
+                "knowledge_bases_saved": len(versions),
+            }
     return None
@@ -0,0 +1,474 @@
+import contextvars
+import hashlib
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from classification import get_classifier, iter_classified
+from terminology import get_replacer
+from rate_limit import RateLimitTimeout, is_throttled
+from prompt_builder import build_prompt, estimate_tokens, format_kb, format_rows, DEFAULT_PROMPT_BUDGET
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRIES = 2
+DEFAULT_CHUNK_TOKENS = 6000
+RETRY_BACKOFF_SECONDS = 1.0
+# Rounds of intermediate merging allowed before the drafts are declared too large to combine.
+MAX_MERGE_ROUNDS = 6
+
+SOURCE_LABELS = {"epics": "Epic", "stories": "Story", "fixes": "Bug Fix"}
+UNCATEGORIZED = "Uncategorized"
+
+# Columns whose change means a row needs a new note; edits to anything else reuse the previous note.
+FINGERPRINT_COLUMNS = [
+    "Issue Type", "Summary", "Description", "Status", "Resolution", "Priority",
+    "Component/s", "Labels", "Fix Version/s", "Epic Link", "Epic Name", "Parent",
+]
+_NOTE_HEADING = re.compile(r"^\s*#{1,6}\s+(?P<category>.+?)\s*$")
+_NOTE_BULLET = re.compile(r"^\s*[-*+]\s*\[(?P<keys>[^\]]+)\]\s*(?P<note>.+?)\s*$")
+
+MAP_PROMPT = """You are drafting part of the release notes for {company}.
+Summarize the following {source_label} items as concise markdown bullets under a "#### <category>" heading
+for each product category in the Category column.
+Write one bullet per item, starting with its issue key in square brackets (e.g. "- [ABC-12] ...").
+Items that describe the same change may share a bullet with comma-separated keys. Skip purely internal work.{assignment}
+
+Items (a "|"-separated table; the line before the rows names the columns):
+{rows}"""
+
+# Appended to MAP_PROMPT when a chunk holds rows that matched no category keyword.
+ASSIGNMENT_PROMPT = """
+Items in the "{uncategorized}" category matched no product category keyword: file each of them under the
+best-fitting category below instead.
+
+Product categories:
+{categories}"""
+
+REDUCE_PROMPT = """You are writing the final release notes for {company}.
+Combine the draft sections below into one polished markdown document with a heading per product category,
+New Features and Improvements before Bug Fixes. Follow the Knowledge Base style rules exactly.
+
+Knowledge Base:
+{kb}
+
+Draft sections:
+{sections}"""
+
+MERGE_PROMPT = """You are condensing draft release-note sections for {company} so they can be combined into one document.
+Merge the sections below into fewer, shorter sections with one "### <type>" heading per type and
+"#### <category>" headings under it.
+Combine bullets that describe the same change and tighten the wording, but keep every user-facing change
+and the issue keys in square brackets at the start of each bullet.
+
+Draft sections:
+{sections}"""
+
+SINGLE_PASS_PROMPT = """Generate release notes in markdown for {company} from the following items.
+Group them by product category (the Category column), New Features and Improvements before Bug Fixes, and follow
+the Knowledge Base style rules exactly. Items in the "{uncategorized}" category matched no product category keyword;
+file each of them under the best-fitting category.
+
+Knowledge Base:
+{kb}
+
+Items (a "|"-separated table; the line before the rows names the columns):
+{rows}"""
+
+INCREMENTAL_PROMPT = """Generate release notes in markdown for {company} from the new or changed items below and the notes
+already written for unchanged items. Group them by product category (the Category column), New Features and Improvements
+before Bug Fixes, and follow the Knowledge Base style rules exactly. Items in the "{uncategorized}" category matched no
+product category keyword; file each of them under the best-fitting category.
+Start every bullet with the issue keys it covers in square brackets (e.g. "- [ABC-12] ..."), and keep the wording of
+the existing notes.
+
+Knowledge Base:
+{kb}
+
+Existing notes:
+{sections}
+
+New or changed items (a "|"-separated table; the line before the rows names the columns):
+{rows}"""
+
+def _row_category(row):
+    """Returns the category a row is grouped under when the KB defines no product categories."""
+    return row.get("Component/s") or "General"
+
+def partition_rows(csv_data, max_chunk_tokens=DEFAULT_CHUNK_TOKENS, classifier=None):
+    """
+    Packs each source file's rows into chunks whose estimated rows stay under max_chunk_tokens.
+    csv_data maps a source key ("epics", "stories", "fixes") to any iterable of row dicts, so streamed
+    records are consumed lazily. Rows are copied with their product category in a "Category" column
+    and ordered by category, so a large category spans consecutive chunks while small ones share one.
+    With a KeywordClassifier, rows are bucketed into KB categories and rows matching no keyword are
+    tagged UNCATEGORIZED; without one, the Jira component is used.
+    Returns: A list of {"source", "rows", "tokens"} dictionaries.
+    """
+    chunks = []
+    for source, rows in csv_data.items():
+        if classifier is not None and classifier.categories:
+            categorized = ((row, category or UNCATEGORIZED) for row, category in iter_classified(rows, classifier))
+        else:
+            categorized = ((row, _row_category(row)) for row in rows)
+        by_category = {}
+        for row, category in categorized:
+            by_category.setdefault(category, []).append({"Category": category, **row})
+        chunk = None
+        for category_rows in by_category.values():
+            for row in category_rows:
+                tokens = estimate_tokens("|".join(row.values()))
+                if chunk is None or (chunk["rows"] and chunk["tokens"] + tokens > max_chunk_tokens):
+                    chunk = {"source": source, "rows": [], "tokens": 0}
+                    chunks.append(chunk)
+                chunk["rows"].append(row)
+                chunk["tokens"] += tokens
+    return chunks
+
+def _retryable(error):
+    """Throttling errors and admission timeouts are not retried here: the shared rate limiter already did."""
+    return not isinstance(error, RateLimitTimeout) and not is_throttled(error)
+
+def call_with_retries(model_fn, prompt, retries=DEFAULT_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    """Calls the model, retrying other failures with exponential backoff before re-raising the last error."""
+    for attempt in range(retries + 1):
+        try:
+            return model_fn(prompt)
+        except Exception as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+def _company(kb):
+    return (kb or {}).get("company_name") or "the company"
+
+def _prompt_kb(kb):
+    """
+    Returns the KB as sent to the model. Category keywords are dropped because rows are categorized
+    locally, and terminology rules because they are applied to the output by terminology.py.
+    """
+    kb = dict(kb or {})
+    if kb.get("product_categories"):
+        kb["product_categories"] = {
+            name: {key: value for key, value in (details or {}).items() if key != "keywords_and_aliases"}
+            for name, details in kb["product_categories"].items()
+        }
+    if kb.get("writing_style_guide"):
+        kb["writing_style_guide"] = {
+            key: value for key, value in kb["writing_style_guide"].items() if key != "terminology_rules"
+        }
+    return kb
+
+def _summarize_chunk(chunk, kb, model_fn, retries, budget_tokens):
+    source_label = SOURCE_LABELS.get(chunk["source"], chunk["source"])
+    categories = (kb or {}).get("product_categories") or {}
+    assignment = ""
+    if categories and any(row["Category"] == UNCATEGORIZED for row in chunk["rows"]):
+        category_list = "\n".join(f"- {name}: {(details or {}).get('description', '')}" for name, details in categories.items())
+        assignment = ASSIGNMENT_PROMPT.format(uncategorized=UNCATEGORIZED, categories=category_list)
+    prompt = build_prompt(
+        MAP_PROMPT, f"map:{chunk['source']}", rows=chunk["rows"], budget_tokens=budget_tokens,
+        company=_company(kb), source_label=source_label, assignment=assignment
+    )
+    return call_with_retries(model_fn, prompt, retries)
+
+def _single_prompt_rows(chunks, budget_tokens):
+    """
+    Returns every chunked row, tagged with its source file, if they fit in budget_tokens without
+    format_rows() having to drop any; otherwise None.
+    """
+    if sum(chunk["tokens"] for chunk in chunks) > budget_tokens:
+        return None
+    rows = [{"Source": SOURCE_LABELS.get(chunk["source"], chunk["source"]), **row} for chunk in chunks for row in chunk["rows"]]
+    return rows if format_rows(rows)[1]["tokens"] <= budget_tokens else None
+
+def stream_with_retries(stream_fn, prompt, retries=DEFAULT_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    """Yields streamed model output, retrying with backoff only if the stream failed before producing any text."""
+    for attempt in range(retries + 1):
+        produced = False
+        try:
+            for text in stream_fn(prompt):
+                produced = True
+                yield text
+            return
+        except Exception as e:
+            if produced or attempt == retries or not _retryable(e):
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+def _pack_sections(sections, budget_tokens):
+    """
+    Groups sections in order so each group's text stays within budget_tokens.
+    Raises: RuntimeError if a single section is larger than the budget.
+    """
+    groups, current, used = [], [], 0
+    for section in sections:
+        tokens = estimate_tokens(section) + 1
+        if tokens > budget_tokens:
+            raise RuntimeError(
+                f"A draft section of ~{tokens} tokens does not fit the {budget_tokens}-token merge budget; "
+                "lower the chunk size or raise the prompt budget."
+            )
+        if current and used + tokens > budget_tokens:
+            groups.append(current)
+            current, used = [], 0
+        current.append(section)
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def _merge_sections(sections, kb, model_fn, retries, pool, budget_tokens, prompt_budget, progress_fn=None):
+    """
+    Merges draft sections into intermediate summaries, a group at a time, until all of them fit in
+    budget_tokens. Sections are sorted by heading first so each group holds related categories.
+    Raises: RuntimeError if a round stops shrinking the drafts or MAX_MERGE_ROUNDS is exceeded,
+    rather than letting the final document silently lose sections.
+    """
+    merge_budget = prompt_budget - estimate_tokens(MERGE_PROMPT.format(company=_company(kb), sections=""))
+    total = estimate_tokens("\n\n".join(sections))
+    for level in range(1, MAX_MERGE_ROUNDS + 1):
+        if total <= budget_tokens:
+            return sections
+        groups = _pack_sections(sorted(sections), merge_budget)
+        if progress_fn:
+            progress_fn(0.9, f"Merging {len(sections)} draft sections into {len(groups)} (round {level})")
+        prompts = [
+            build_prompt(MERGE_PROMPT, f"merge:{level}", budget_tokens=prompt_budget,
+                         company=_company(kb), sections="\n\n".join(group))
+            for group in groups
+        ]
+        # Each call runs in a copy of the caller's context so tracing labels (org, user) reach the pool threads.
+        futures = [pool.submit(contextvars.copy_context().run, call_with_retries, model_fn, prompt, retries) for prompt in prompts]
+        sections = [future.result().strip() for future in futures]
+        merged_total = estimate_tokens("\n\n".join(sections))
+        if merged_total >= total:
+            raise RuntimeError(f"Merging draft sections stopped shrinking them (~{merged_total} tokens); cannot fit the prompt budget.")
+        total = merged_total
+    if total > budget_tokens:
+        raise RuntimeError(f"Draft sections still exceed the prompt budget after {MAX_MERGE_ROUNDS} merge rounds.")
+    return sections
+
+def categories_fingerprint(kb):
+    """Returns a short hash of the KB's product categories, including their descriptions and keywords."""
+    categories = (kb or {}).get("product_categories") or {}
+    return hashlib.sha256(json.dumps(categories, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def row_identity(row, kb_fingerprint=""):
+    """
+    Returns (row_key, fingerprint) for a row: its Jira issue key (or a content hash when it has none)
+    and a SHA-256 of the columns that affect its release note plus kb_fingerprint, so notes are
+    rewritten when the categories they were filed under change.
+    """
+    content = json.dumps({column: row.get(column, "") for column in FINGERPRINT_COLUMNS}, sort_keys=True)
+    fingerprint = hashlib.sha256((content + kb_fingerprint).encode("utf-8")).hexdigest()
+    return row.get("Issue key") or hashlib.sha256(content.encode("utf-8")).hexdigest()[:16], fingerprint
+
+def parse_row_notes(summary):
+    """
+    Extracts per-item notes from a map-stage summary written as "- [KEY] note" bullets.
+    Returns: A dict of issue key -> (category heading above the bullet or None, note text).
+    """
+    notes = {}
+    category = None
+    for line in summary.splitlines():
+        heading = _NOTE_HEADING.match(line)
+        if heading:
+            category = heading.group("category")
+            continue
+        bullet = _NOTE_BULLET.match(line)
+        if bullet:
+            for key in bullet.group("keys").split(","):
+                if key.strip():
+                    notes[key.strip()] = (category, bullet.group("note"))
+    return notes
+
+def _changed_rows(source, rows, prior_notes, reused, kb_fingerprint=""):
+    """Yields rows that are new or changed since their last note; unchanged rows' notes go to reused instead."""
+    for row in rows:
+        key, fingerprint = row_identity(row, kb_fingerprint)
+        prior = prior_notes.get((source, key))
+        if prior and prior["fingerprint"] == fingerprint:
+            reused.append({"source": source, "row_key": key, "fingerprint": fingerprint,
+                           "category": prior["category"], "note": prior["note"]})
+            continue
+        if "Issue key" not in row:
+            row = {"Issue key": key, **row}
+        yield row
+
+def _collect_row_notes(chunks, summaries, kb_fingerprint=""):
+    """
+    Matches each summarized row to the note the model wrote for it; rows without one are left out.
+    Rows sharing a (source, row_key), e.g. a repeated issue key, keep only the last note so the batched
+    upsert never touches the same row twice.
+    """
+    notes = {}
+    for chunk, summary in zip(chunks, summaries):
+        parsed = parse_row_notes(summary)
+        for row in chunk["rows"]:
+            key, fingerprint = row_identity(row, kb_fingerprint)
+            if key in parsed:
+                category, note = parsed[key]
+                notes[(chunk["source"], key)] = {"source": chunk["source"], "row_key": key, "fingerprint": fingerprint,
+                                                 "category": category or row["Category"], "note": note}
+    return list(notes.values())
+
+def _reused_sections(reused):
+    """Renders reused notes as draft sections grouped by source and category."""
+    grouped = {}
+    for note in reused:
+        grouped.setdefault((note["source"], note["category"]), []).append(f"- [{note['row_key']}] {note['note']}")
+    return [
+        f"### {SOURCE_LABELS.get(source, source)}\n#### {category}\n" + "\n".join(lines)
+        for (source, category), lines in grouped.items()
+    ]
+
+def _lines(pieces):
+    """Regroups streamed text into lines, each with its newline except possibly the last."""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        *complete, buffer = buffer.split("\n")
+        for line in complete:
+            yield line + "\n"
+    if buffer:
+        yield buffer
+
+def _strip_note_keys(pieces, chunks, known_keys, categories, notes, kb_fingerprint):
+    """
+    Yields a single-pass incremental document with the "[KEY]" markers removed from its bullets,
+    recording in notes the bullet written for each new or changed row. A row the classifier left
+    uncategorized is filed under the KB category heading its bullet appeared beneath.
+    """
+    rows_by_key = {}
+    for chunk in chunks:
+        for row in chunk["rows"]:
+            rows_by_key.setdefault(row_identity(row)[0], []).append((chunk["source"], row))
+    category = None
+    for line in _lines(pieces):
+        heading = _NOTE_HEADING.match(line)
+        if heading and heading.group("category") in categories:
+            category = heading.group("category")
+        bullet = _NOTE_BULLET.match(line)
+        keys = [key.strip() for key in bullet.group("keys").split(",")] if bullet else []
+        if any(key in known_keys for key in keys):
+            for key in keys:
+                for source, row in rows_by_key.get(key, ()):
+                    notes[(source, key)] = {
+                        "source": source, "row_key": key, "fingerprint": row_identity(row, kb_fingerprint)[1],
+                        "category": row["Category"] if row["Category"] != UNCATEGORIZED else category or UNCATEGORIZED,
+                        "note": bullet.group("note"),
+                    }
+            line = line[:bullet.start("keys") - 1].rstrip() + " " + bullet.group("note") + ("\n" if line.endswith("\n") else "")
+        yield line
+
+def stream_release_notes(kb, csv_data, model_fn=None, stream_fn=None, max_workers=DEFAULT_MAX_WORKERS,
+                         retries=DEFAULT_RETRIES, max_chunk_tokens=DEFAULT_CHUNK_TOKENS, progress_fn=None,
+                         prior_notes=None, notes_fn=None, prompt_budget=DEFAULT_PROMPT_BUDGET):
+    """
+    Generates release notes with a map-reduce pass over the uploaded rows, yielding the final document as it streams.
+    Rows are pre-classified into KB categories and partitioned into token-budgeted chunks; each chunk is
+    summarized concurrently on a bounded thread pool (at most max_workers model calls in flight), and a
+    final streamed reduce call merges the drafts while applying the KB style rules. Terminology rules are
+    then applied to the streamed output locally.
+
+    model_fn takes a prompt and returns text; stream_fn takes a prompt and yields text. They default to
+    utils.generate_text and utils.stream_text; if only model_fn is given, its result is yielded in one piece.
+    progress_fn, if given, is called as progress_fn(fraction, message) as chunks complete.
+
+    For incremental runs, prior_notes maps (source, row_key) to the {"fingerprint", "category", "note"}
+    saved from earlier runs: rows whose fingerprint is unchanged reuse that note and are not sent to the
+    model, and fingerprints include the KB categories so a category edit rewrites every note. notes_fn is
+    called once with the notes written for new or changed rows so they can be saved.
+    Rows that fit in one prompt_budget (alongside the reused notes, for incremental runs) are handled by a
+    single call; an incremental run with no new or changed rows skips straight to the final document.
+
+    Every prompt is assembled by prompt_builder within prompt_budget estimated tokens. When the drafts are
+    too large for one reduce prompt they are first merged into intermediate summaries (see _merge_sections).
+    """
+    if model_fn is None:
+        from utils import generate_text, stream_text
+        model_fn = generate_text
+        stream_fn = stream_fn or stream_text
+    if stream_fn is None:
+        stream_fn = lambda prompt: iter([model_fn(prompt)])
+
+    incremental = prior_notes is not None or notes_fn is not None
+    reused = []
+    kb_fingerprint = categories_fingerprint(kb) if incremental else ""
+    if incremental:
+        csv_data = {
+            source: _changed_rows(source, rows, prior_notes or {}, reused, kb_fingerprint)
+            for source, rows in csv_data.items()
+        }
+
+    prompt_kb = _prompt_kb(kb)
+    replacer = get_replacer(kb)
+    chunks = partition_rows(csv_data, max_chunk_tokens, classifier=get_classifier(kb))
+    if not chunks and not reused:
+        return
+    if not incremental:
+        single_fixed = SINGLE_PASS_PROMPT.format(kb=format_kb(prompt_kb), rows="", company=_company(kb), uncategorized=UNCATEGORIZED)
+        rows = _single_prompt_rows(chunks, prompt_budget - estimate_tokens(single_fixed))
+        if rows is not None:
+            prompt = build_prompt(
+                SINGLE_PASS_PROMPT, "single", kb=prompt_kb, rows=rows, budget_tokens=prompt_budget,
+                company=_company(kb), uncategorized=UNCATEGORIZED
+            )
+            yield from replacer.stream(stream_with_retries(stream_fn, prompt, retries))
+            return
+    elif chunks:
+        existing = "\n\n".join(_reused_sections(reused)) or "(none)"
+        single_fixed = INCREMENTAL_PROMPT.format(
+            kb=format_kb(prompt_kb), rows="", sections=existing, company=_company(kb), uncategorized=UNCATEGORIZED
+        )
+        rows = _single_prompt_rows(chunks, prompt_budget - estimate_tokens(single_fixed))
+        if rows is not None:
+            prompt = build_prompt(
+                INCREMENTAL_PROMPT, "single:incremental", kb=prompt_kb, rows=rows, budget_tokens=prompt_budget,
+                company=_company(kb), uncategorized=UNCATEGORIZED, sections=existing
+            )
+            categories = set((kb or {}).get("product_categories") or {}) | {row["Category"] for row in rows}
+            known_keys = {row_identity(row)[0] for row in rows} | {note["row_key"] for note in reused}
+            notes = {}
+            yield from replacer.stream(_strip_note_keys(
+                stream_with_retries(stream_fn, prompt, retries), chunks, known_keys, categories, notes, kb_fingerprint
+            ))
+            if notes_fn:
+                notes_fn(list(notes.values()))
+            return
+
+    summaries = [None] * len(chunks)
+    reduce_fixed = REDUCE_PROMPT.format(kb=format_kb(prompt_kb), company=_company(kb), sections="")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Tasks run in a copy of the caller's context so tracing labels (org, user) reach the pool threads.
+        futures = {
+            pool.submit(contextvars.copy_context().run, _summarize_chunk, chunk, kb, model_fn, retries, prompt_budget): i
+            for i, chunk in enumerate(chunks)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            summaries[futures[future]] = future.result()
+            if progress_fn:
+                progress_fn(0.9 * done / len(chunks), f"Summarized {done} of {len(chunks)} sections")
+        if notes_fn:
+            notes_fn(_collect_row_notes(chunks, summaries, kb_fingerprint))
+
+        sections = [
+            f"### {SOURCE_LABELS.get(chunk['source'], chunk['source'])}\n{summary.strip()}"
+            for chunk, summary in zip(chunks, summaries)
+        ] + _reused_sections(reused)
+        sections = _merge_sections(
+            sections, kb, model_fn, retries, pool, prompt_budget - estimate_tokens(reduce_fixed), prompt_budget, progress_fn
+        )
+    if progress_fn:
+        progress_fn(0.9, f"Writing the final document ({len(reused)} unchanged items reused)")
+
+    prompt = build_prompt(
+        REDUCE_PROMPT, "reduce", kb=prompt_kb, budget_tokens=prompt_budget, company=_company(kb),
+        sections="\n\n".join(sections)
+    )
+    yield from replacer.stream(stream_with_retries(stream_fn, prompt, retries))
+
+def generate_release_notes(kb, csv_data, model_fn=None, stream_fn=None, **options):
+    """Runs stream_release_notes() to completion and returns the whole markdown document."""
+    return "".join(stream_release_notes(kb, csv_data, model_fn=model_fn, stream_fn=stream_fn, **options))
@@ -0,0 +1,139 @@
+import functools
+import os
+import socket
+import threading
+import time
+
+import streamlit as st
+
+import database as db
+import tracing
+from generation import stream_release_notes, row_identity, DEFAULT_MAX_WORKERS, DEFAULT_CHUNK_TOKENS
+from utils import generate_text, stream_text
+
+POLL_SECONDS = 2.0
+PROGRESS_FLUSH_SECONDS = 1.0
+STALE_JOB_SECONDS = 300
+# Heartbeats run on their own timer so slow or queued model calls never make a live job look stale.
+HEARTBEAT_SECONDS = STALE_JOB_SECONDS / 10
+MAX_JOB_ATTEMPTS = 3
+
+_workers = []
+_workers_lock = threading.Lock()
+
+class JobLost(Exception):
+    """Raised inside a running job once it has been requeued and may be running on another worker."""
+
+def _heartbeat(job_id, worker_id, stop, lost):
+    """Refreshes a job's heartbeat every HEARTBEAT_SECONDS until stopped, flagging lost if the job was taken away."""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            if not db.heartbeat_generation_job(job_id, worker_id):
+                lost.set()
+                return
+        except Exception:
+            continue
+
+def _run_job(job, worker_id, lost):
+    """
+    Generates the release notes for one claimed job, saving progress and partial output as it goes.
+    Only rows that are new or changed since an earlier job are sent to the model.
+    Raises: JobLost at the next progress report after the heartbeat found the job taken away.
+    """
+    org_id = job["org_id"]
+    tracing.set_labels(org=org_id, user=job["user_id"])
+    kb = db.get_kb_for_organization(org_id)
+    payload = job["payload"]
+    if "csv_data" in payload:
+        # Jobs queued before rows moved to generation_job_rows carry them in the payload.
+        csv_data = payload["csv_data"]
+        prior_notes = db.get_release_note_rows(org_id, {row_identity(row)[0] for rows in csv_data.values() for row in rows})
+    else:
+        csv_data = {source: db.iter_generation_job_rows(job["id"], source) for source in payload.get("sources", [])}
+        prior_notes = db.get_job_release_note_rows(org_id, job["id"])
+    last_flush = 0.0
+
+    def report(progress, message=None, partial_result=None, force=False):
+        """Flushes progress at most every PROGRESS_FLUSH_SECONDS; partial_result is a callable run only on a flush."""
+        nonlocal last_flush
+        if lost.is_set():
+            raise JobLost(f"Job {job['id']} was requeued while running on {worker_id}")
+        now = time.monotonic()
+        if force or now - last_flush >= PROGRESS_FLUSH_SECONDS:
+            db.update_generation_job_progress(job["id"], worker_id, progress, message, partial_result() if partial_result else None)
+            last_flush = now
+
+    parts = []
+    stream = stream_release_notes(
+        kb, csv_data,
+        model_fn=functools.partial(generate_text, org_id=org_id),
+        stream_fn=functools.partial(stream_text, org_id=org_id),
+        max_workers=int(st.secrets.get("GENERATION_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        max_chunk_tokens=int(st.secrets.get("GENERATION_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS)),
+        progress_fn=lambda progress, message: report(progress, message, force=True),
+        prior_notes=prior_notes,
+        notes_fn=lambda notes: db.save_release_note_rows(org_id, notes),
+    )
+    for text in stream:
+        parts.append(text)
+        report(0.95, "Writing the final document", lambda: "".join(parts))
+    return "".join(parts)
+
+def _worker_loop(worker_id):
+    """Claims and runs queued jobs until the process exits."""
+    last_sweep = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_sweep > STALE_JOB_SECONDS / 2:
+                db.requeue_stale_generation_jobs(STALE_JOB_SECONDS, MAX_JOB_ATTEMPTS)
+                last_sweep = time.monotonic()
+            job = db.claim_generation_job(worker_id)
+        except Exception:
+            job = None
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(job["id"], worker_id, stop, lost), name=f"job-heartbeat-{job['id']}", daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = _run_job(job, worker_id, lost)
+            if db.finish_generation_job(job["id"], worker_id, result=result):
+                db.save_release_notes(job["org_id"], job["id"], result)
+        except JobLost:
+            pass
+        except Exception as e:
+            try:
+                db.finish_generation_job(job["id"], worker_id, error=str(e) or e.__class__.__name__)
+            except Exception:
+                # Keep the worker alive; the stale-job sweep requeues or fails the job once its heartbeat lapses.
+                pass
+        finally:
+            stop.set()
+            heartbeat.join()
+
+def start_workers(count=None):
+    """
+    Starts the background generation workers for this process (once; later calls are no-ops).
+    The worker count comes from GENERATION_WORKERS; set it to 0 on replicas that should only enqueue.
+    """
+    with _workers_lock:
+        if _workers:
+            return _workers
+        count = int(st.secrets.get("GENERATION_WORKERS", 2)) if count is None else count
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for index in range(count):
+            worker = threading.Thread(
+                target=_worker_loop, args=(f"{prefix}:{index}",), name=f"generation-worker-{index}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+        return _workers
+
+if __name__ == "__main__":
+    # Run as a dedicated worker process: `python jobs.py`
+    db.setup_database()
+    for worker in start_workers():
+        worker.join()
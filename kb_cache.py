@@ -0,0 +1,104 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+KB_CHANGED_CHANNEL = "kb_changed"
+
+class KBCache:
+    """
+    Thread-safe, process-wide LRU cache of knowledge bases keyed by org_id.
+    Entries are dropped on write or NOTIFY; the TTL is only a backstop for missed notifications.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, org_id):
+        """Returns the cached (version, kb_content) for an org, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(org_id)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl_seconds:
+                del self._entries[org_id]
+                self._stats["evictions"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(org_id)
+            self._stats["hits"] += 1
+            return entry[0], entry[1]
+
+    def put(self, org_id, version, kb_content):
+        """Stores a knowledge base, ignoring it if a newer version is already cached."""
+        with self._lock:
+            current = self._entries.get(org_id)
+            if current is not None and current[0] > version:
+                return
+            self._entries[org_id] = (version, kb_content, time.monotonic())
+            self._entries.move_to_end(org_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, org_id=None):
+        """Drops one org's entry, or every entry when org_id is None."""
+        with self._lock:
+            if org_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(org_id, None)
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def start_invalidation_listener(dsn, cache, poll_seconds=5.0):
+    """
+    Starts a daemon thread that LISTENs for knowledge-base changes made by any app replica
+    and evicts the affected org from the cache. Returns the thread.
+    """
+    def listen():
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {KB_CHANGED_CHANNEL};")
+                # Anything could have changed while we were not listening.
+                cache.invalidate()
+                backoff = 1.0
+                while True:
+                    if select.select([conn], [], [], poll_seconds) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            cache.invalidate(int(notify.payload))
+                        except ValueError:
+                            cache.invalidate()
+            except (psycopg2.Error, OSError):
+                if conn is not None:
+                    conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    thread = threading.Thread(target=listen, name="kb-cache-listener", daemon=True)
+    thread.start()
+    return thread
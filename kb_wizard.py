@@ -1,10 +1,12 @@
 import streamlit as st
-import pandas as pd
 import json
 import database as db
+from provisioning import build_kb, DEFAULT_TONE_RULE
 
-def show_kb_wizard():
+def show_kb_wizard(org_id):
     """Displays a wizard to create a KB and saves it to the database."""
+    import pandas as pd
+
     st.header("Knowledge Base Setup")
     
     # Initialize session state for wizard data
@@ -27,32 +29,22 @@ def show_kb_wizard():
     st.session_state.product_categories_df = st.data_editor(st.session_state.product_categories_df, num_rows="dynamic", use_container_width=True)
 
     st.subheader("Step 3: Establish Writing & Style Rules")
-    st.session_state.kb_data_input['tone_rule'] = st.text_area("General Tone of Voice", "Adopt a neutral, professional tone (Microsoft Style Guide). State facts directly.")
+    st.session_state.kb_data_input['tone_rule'] = st.text_area("General Tone of Voice", DEFAULT_TONE_RULE)
     st.markdown("##### Terminology Replacements")
     st.session_state.terminology_df = st.data_editor(st.session_state.terminology_df, num_rows="dynamic", use_container_width=True)
 
     if st.button("Save Configuration", use_container_width=True, type="primary"):
-        final_kb = {
-            "company_name": st.session_state.kb_data_input.get('company_name', st.session_state.user.get('org_name', '')),
-            "product_categories": {
-                row["Category Name"]: {
-                    "description": row["Description"],
-                    "keywords_and_aliases": [k.strip() for k in row["Keywords & Aliases (comma-separated)"].split(',')]
-                } for index, row in st.session_state.product_categories_df.iterrows()
-            },
-            "writing_style_guide": {
-                "professional_tone_rule": st.session_state.kb_data_input.get('tone_rule', ''),
-                 "terminology_rules": {
-                    row["Term to Replace"]: row["Correct Term"]
-                    for index, row in st.session_state.terminology_df.iterrows()
-                }
-            }
-        }
+        final_kb = build_kb(
+            st.session_state.kb_data_input.get('company_name', st.session_state.user.get('org_name', '')),
+            st.session_state.kb_data_input.get('tone_rule', ''),
+            st.session_state.product_categories_df,
+            st.session_state.terminology_df,
+        )
         
-        db.save_knowledge_base(st.session_state.user['org_id'], final_kb)
+        db.save_kb_for_organization(org_id, final_kb)
         st.success("Knowledge Base configuration saved successfully!")
         
         st.session_state.kb_content = final_kb
-        st.session_state.workflow = 'selection'
+        st.session_state.app_state = "main_app"
         st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
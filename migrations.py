@@ -0,0 +1,140 @@
+import psycopg2
+
+# Arbitrary application-wide key for the advisory lock that serialises migrations
+# across app replicas starting at the same time.
+MIGRATION_LOCK_KEY = 7_315_004_211
+
+# Ordered schema changes as (version, description, statements). Never edit a migration
+# that has shipped; append a new one with the next version number instead.
+MIGRATIONS = [
+    (1, "Create organizations, users and knowledge_bases", [
+        """
+        CREATE TABLE IF NOT EXISTS organizations (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            org_id INTEGER REFERENCES organizations(id),
+            name VARCHAR(255),
+            email VARCHAR(255) UNIQUE NOT NULL,
+            picture_url TEXT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS knowledge_bases (
+            id SERIAL PRIMARY KEY,
+            org_id INTEGER UNIQUE REFERENCES organizations(id),
+            kb_content JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ]),
+    (2, "Version knowledge bases for cache invalidation", [
+        "ALTER TABLE knowledge_bases ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;",
+        "ALTER TABLE knowledge_bases ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;",
+    ]),
+    (3, "Create generation_jobs queue", [
+        """
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id SERIAL PRIMARY KEY,
+            org_id INTEGER NOT NULL REFERENCES organizations(id),
+            user_id INTEGER REFERENCES users(id),
+            status VARCHAR(16) NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            progress_message TEXT,
+            payload JSONB NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id VARCHAR(255),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP WITH TIME ZONE,
+            heartbeat_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS generation_jobs_queued ON generation_jobs (created_at) WHERE status = 'queued';",
+        "CREATE INDEX IF NOT EXISTS generation_jobs_user ON generation_jobs (user_id, created_at DESC);",
+    ]),
+    (4, "Persist release notes and per-row notes for incremental generation", [
+        """
+        CREATE TABLE IF NOT EXISTS release_notes (
+            id SERIAL PRIMARY KEY,
+            org_id INTEGER NOT NULL REFERENCES organizations(id),
+            job_id INTEGER REFERENCES generation_jobs(id),
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS release_notes_org ON release_notes (org_id, created_at DESC);",
+        """
+        CREATE TABLE IF NOT EXISTS release_note_rows (
+            org_id INTEGER NOT NULL REFERENCES organizations(id),
+            source VARCHAR(32) NOT NULL,
+            row_key VARCHAR(255) NOT NULL,
+            fingerprint CHAR(64) NOT NULL,
+            category VARCHAR(255),
+            note TEXT NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (org_id, source, row_key)
+        );
+        """,
+    ]),
+    (5, "Store generation job rows outside the job payload", [
+        """
+        CREATE TABLE IF NOT EXISTS generation_job_rows (
+            job_id INTEGER NOT NULL REFERENCES generation_jobs(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            source VARCHAR(32) NOT NULL,
+            row_key VARCHAR(255) NOT NULL,
+            record JSONB NOT NULL,
+            PRIMARY KEY (job_id, position)
+        );
+        """,
+    ]),
+    # Fails if existing users differ only by email case; merge those accounts before upgrading.
+    (6, "Match user emails case-insensitively", [
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_email_lower ON users (lower(email));",
+    ]),
+]
+
+def get_schema_version(cur):
+    """Returns the highest applied migration version, or 0 for a fresh database."""
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+    return cur.fetchone()[0]
+
+def apply_migrations(conn):
+    """
+    Applies every migration newer than the recorded schema version in a single transaction.
+    Returns: The list of versions that were applied (empty if the schema was already current).
+    """
+    applied = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            current = get_schema_version(cur)
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+                    (version, description)
+                )
+                applied.append(version)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    return applied
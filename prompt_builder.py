@@ -0,0 +1,156 @@
+import json
+import logging
+import threading
+from collections import Counter
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPT_BUDGET = 30000
+# Prompt label prefixes (the part before ":") counted separately in the "prompts" collector.
+PROMPT_KINDS = ("single", "map", "merge", "reduce")
+# Values at least this long that repeat across rows are written once and referenced as &1, &2, ...
+DEDUPE_MIN_CHARS = 24
+
+ISSUE_TYPE_RANK = {"epic": 0, "new feature": 0, "story": 1, "improvement": 1, "bug": 2, "task": 3, "sub-task": 4}
+PRIORITY_RANK = {
+    "blocker": 0, "highest": 0, "critical": 0, "high": 1, "major": 1,
+    "medium": 2, "low": 3, "minor": 3, "lowest": 4, "trivial": 4,
+}
+
+_prompt_stats = {
+    f"{kind}_{counter}": 0 for kind in PROMPT_KINDS + ("other",)
+    for counter in ("prompts", "tokens_total", "tokens_max", "kb_tokens_total", "rows_dropped")
+}
+_prompt_stats_lock = threading.Lock()
+
+tracing.register_collector("prompts", lambda: get_prompt_stats())
+
+def estimate_tokens(text):
+    """Roughly estimates the model token count of a string (about four characters per token)."""
+    return len(text) // 4 + 1
+
+def _cell(value):
+    return str(value).replace("|", "/").replace("\n", " ").strip()
+
+def _row_rank(indexed_row):
+    """Sort key putting the rows to keep first: epics and features before tasks, high priority before low."""
+    index, row = indexed_row
+    return (
+        ISSUE_TYPE_RANK.get(str(row.get("Issue Type", "")).lower(), 3),
+        PRIORITY_RANK.get(str(row.get("Priority", "")).lower(), 2),
+        index,
+    )
+
+def _kb_value(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False) if isinstance(value, (dict, list)) else str(value)
+
+def format_kb(kb):
+    """
+    Serializes a KB compactly: settings as "key: value" lines (nested settings as "key.sub_key: value"),
+    product categories as a name|description table, and list or dict values as compact JSON.
+    """
+    lines = []
+    for key, value in (kb or {}).items():
+        if key == "product_categories" and isinstance(value, dict):
+            lines.append("product_categories (name|description):")
+            lines.extend(f"{_cell(name)}|{_cell((details or {}).get('description', ''))}" for name, details in value.items())
+        elif isinstance(value, dict):
+            lines.extend(f"{key}.{sub_key}: {_kb_value(sub_value)}" for sub_key, sub_value in value.items() if sub_value)
+        elif value:
+            lines.append(f"{key}: {_kb_value(value)}")
+    return "\n".join(lines)
+
+def format_rows(rows, budget_tokens=None):
+    """
+    Serializes rows as a pipe-separated table: one header line naming the columns, values shared by
+    every row hoisted into a single line, long repeated values replaced by &N references, and empty
+    columns left out. When budget_tokens is set, the lowest-priority rows are dropped to fit and
+    summarized in a closing line.
+    Returns: (text, stats) where stats describes the composition for logging.
+    """
+    rows = list(rows)
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    shared = {}
+    if len(rows) > 1:
+        for column in columns:
+            first = rows[0].get(column)
+            if first and all(row.get(column) == first for row in rows):
+                shared[column] = first
+    columns = [c for c in columns if c not in shared]
+
+    counts = Counter(
+        value for row in rows for column in columns
+        for value in [row.get(column)] if value and len(str(value)) >= DEDUPE_MIN_CHARS
+    )
+    references = {value: f"&{i}" for i, value in enumerate((v for v, n in counts.items() if n > 1), start=1)}
+
+    lines = [
+        "|".join(_cell(references.get(row.get(column), row.get(column, ""))) for column in columns)
+        for row in rows
+    ]
+    header = [f"Shared by every item: {'; '.join(f'{k}={_cell(v)}' for k, v in shared.items())}"] if shared else []
+    header += [f"{ref} = {_cell(value)}" for value, ref in references.items()]
+    header.append("|".join(_cell(c) for c in columns))
+
+    kept = list(range(len(rows)))
+    omitted_line = []
+    if budget_tokens is not None:
+        used = sum(estimate_tokens(line) for line in header)
+        kept = []
+        for index, _ in sorted(enumerate(rows), key=_row_rank):
+            cost = estimate_tokens(lines[index])
+            if used + cost > budget_tokens:
+                continue
+            kept.append(index)
+            used += cost
+        kept.sort()
+        if len(kept) < len(rows):
+            dropped = Counter(str(rows[i].get("Issue Type") or "Other") for i in set(range(len(rows))) - set(kept))
+            omitted_line = [f"({len(rows) - len(kept)} lower-priority items omitted: "
+                            + ", ".join(f"{kind} {n}" for kind, n in dropped.most_common()) + ")"]
+
+    text = "\n".join(header + [lines[i] for i in kept] + omitted_line)
+    stats = {
+        "rows": len(rows), "rows_dropped": len(rows) - len(kept), "columns": len(columns),
+        "shared_columns": len(shared), "references": len(references), "tokens": estimate_tokens(text),
+    }
+    return text, stats
+
+@tracing.traced("build_prompt")
+def build_prompt(template, label, kb=None, rows=None, budget_tokens=DEFAULT_PROMPT_BUDGET, **fields):
+    """
+    Fills a prompt template's {kb} and {rows} slots with their compact serializations plus any other
+    fields, and gives the rows whatever budget the rest of the prompt leaves. The prompt's size is
+    counted in the "prompts" collector under the label's kind and logged at INFO with its composition.
+    """
+    kb_text = format_kb(kb) if kb is not None else ""
+    fixed = template.format(kb=kb_text, rows="", **fields)
+    rows_text, row_stats = ("", {})
+    if rows is not None:
+        rows_text, row_stats = format_rows(rows, max(budget_tokens - estimate_tokens(fixed), 0))
+    prompt = template.format(kb=kb_text, rows=rows_text, **fields)
+    _record_prompt(label, estimate_tokens(prompt), estimate_tokens(kb_text) if kb_text else 0, row_stats.get("rows_dropped", 0))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "prompt=%s tokens=%d budget=%d kb_tokens=%d row_tokens=%d %s",
+            label, estimate_tokens(prompt), budget_tokens, estimate_tokens(kb_text) if kb_text else 0,
+            row_stats.get("tokens", 0), " ".join(f"{k}={v}" for k, v in row_stats.items() if k != "tokens"),
+        )
+    return prompt
+
+def _record_prompt(label, tokens, kb_tokens, rows_dropped):
+    kind = label.split(":", 1)[0]
+    kind = kind if kind in PROMPT_KINDS else "other"
+    with _prompt_stats_lock:
+        _prompt_stats[f"{kind}_prompts"] += 1
+        _prompt_stats[f"{kind}_tokens_total"] += tokens
+        _prompt_stats[f"{kind}_tokens_max"] = max(_prompt_stats[f"{kind}_tokens_max"], tokens)
+        _prompt_stats[f"{kind}_kb_tokens_total"] += kb_tokens
+        _prompt_stats[f"{kind}_rows_dropped"] += rows_dropped
+
+def get_prompt_stats():
+    """Returns per-kind counts of prompts built, their estimated token totals and maximum, and rows dropped to fit."""
+    with _prompt_stats_lock:
+        return dict(_prompt_stats)
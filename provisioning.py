@@ -0,0 +1,210 @@
+"""
+Bulk provisioning of organizations, users and knowledge bases from CSV or JSON files.
+
+    python provisioning.py --orgs orgs.csv --users users.csv \
+        --categories categories.csv --terminology terminology.json [--dry-run]
+
+Every file is optional and may be a CSV or a JSON list of records. Columns (matched case-insensitively):
+    orgs         Organization, Company Name (optional), Tone Rule (optional)
+    users        Email, Organization, Name (optional), Picture URL (optional)
+    categories   Organization, Category Name, Description, Keywords & Aliases (comma-separated)
+    terminology  Organization, Term to Replace, Correct Term
+
+When an orgs file is given, every organization referenced elsewhere must be listed in it.
+An organization with categories or terminology gets a knowledge base built from them,
+which replaces its current one. All rows are validated before anything is written.
+"""
+import argparse
+import json
+import os
+import sys
+
+ORGANIZATION = "Organization"
+CATEGORY_NAME = "Category Name"
+DESCRIPTION = "Description"
+KEYWORDS = "Keywords & Aliases (comma-separated)"
+TERM = "Term to Replace"
+CORRECT_TERM = "Correct Term"
+DEFAULT_TONE_RULE = "Adopt a neutral, professional tone (Microsoft Style Guide). State facts directly."
+
+SCHEMAS = {
+    "orgs": ([ORGANIZATION], ["Company Name", "Tone Rule"]),
+    "users": (["Email", ORGANIZATION], ["Name", "Picture URL"]),
+    "categories": ([ORGANIZATION, CATEGORY_NAME], [DESCRIPTION, KEYWORDS]),
+    "terminology": ([ORGANIZATION, TERM, CORRECT_TERM], []),
+}
+MAX_NAME_CHARS = 255
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+
+def _clean(df, key):
+    """Fills blanks, strips every cell, drops rows without a key and keeps the last row per key."""
+    df = df.fillna("").astype(str).apply(lambda column: column.str.strip())
+    df = df[df[key] != ""]
+    return df.drop_duplicates(subset=[key], keep="last")
+
+def build_kb(company_name, tone_rule, categories, terminology):
+    """
+    Builds a knowledge base from category and terminology tables (the kb_wizard column layout).
+    Blank rows are skipped and the last row wins when a category or term is repeated.
+    """
+    categories = _clean(categories.reindex(columns=[CATEGORY_NAME, DESCRIPTION, KEYWORDS]), CATEGORY_NAME)
+    terminology = _clean(terminology.reindex(columns=[TERM, CORRECT_TERM]), TERM)
+    keywords = categories[KEYWORDS].str.split(",")
+    return {
+        "company_name": company_name,
+        "product_categories": {
+            name: {
+                "description": description,
+                "keywords_and_aliases": [k.strip() for k in parts if k.strip()],
+            }
+            for name, description, parts in zip(categories[CATEGORY_NAME], categories[DESCRIPTION], keywords)
+        },
+        "writing_style_guide": {
+            "professional_tone_rule": tone_rule,
+            "terminology_rules": dict(zip(terminology[TERM], terminology[CORRECT_TERM])),
+        },
+    }
+
+def load_table(path, kind):
+    """
+    Reads one input file into a DataFrame of strings with the schema's column names.
+    Raises: ValueError if a required column is missing.
+    """
+    import pandas as pd
+
+    if os.path.splitext(path)[1].lower() == ".json":
+        with open(path, encoding="utf-8") as f:
+            df = pd.DataFrame.from_records(json.load(f))
+    else:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    required, optional = SCHEMAS[kind]
+    by_lower = {str(column).strip().lower(): column for column in df.columns}
+    missing = [column for column in required if column.lower() not in by_lower]
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+    df = df.rename(columns={by_lower[c.lower()]: c for c in required + optional if c.lower() in by_lower})
+    df = df.reindex(columns=required + optional).fillna("").astype(str)
+    return df.apply(lambda column: column.str.strip())
+
+def _report(errors, kind, df, mask, message):
+    """Adds one error per flagged row; rows are numbered from 1 in file order."""
+    errors.extend(f"{kind} row {i + 1}: {message}" for i in df.index[mask])
+
+def validate(tables):
+    """
+    Checks every table in one pass per rule.
+    Args:
+        tables: A dict of kind ("orgs", "users", ...) -> DataFrame from load_table().
+    Returns: A list of error messages; empty when the import can be written.
+    """
+    errors = []
+    for kind, df in tables.items():
+        _report(errors, kind, df, df[ORGANIZATION] == "", "organization is empty")
+        _report(errors, kind, df, df[ORGANIZATION].str.len() > MAX_NAME_CHARS,
+                f"organization is longer than {MAX_NAME_CHARS} characters")
+
+    orgs = tables.get("orgs")
+    if orgs is not None:
+        _report(errors, "orgs", orgs, orgs.duplicated(ORGANIZATION, keep=False) & (orgs[ORGANIZATION] != ""),
+                "organization is listed more than once")
+        known = orgs[ORGANIZATION]
+        for kind, df in tables.items():
+            if kind != "orgs":
+                _report(errors, kind, df, ~df[ORGANIZATION].isin(known) & (df[ORGANIZATION] != ""),
+                        "organization is not in the orgs file")
+
+    users = tables.get("users")
+    if users is not None:
+        emails = users["Email"].str.lower()
+        _report(errors, "users", users, ~emails.str.fullmatch(EMAIL_PATTERN), "email is not valid")
+        _report(errors, "users", users, emails.duplicated(keep=False) & (emails != ""), "email is listed more than once")
+        _report(errors, "users", users, users["Name"].str.len() > MAX_NAME_CHARS,
+                f"name is longer than {MAX_NAME_CHARS} characters")
+
+    categories = tables.get("categories")
+    if categories is not None:
+        _report(errors, "categories", categories, categories[CATEGORY_NAME] == "", "category name is empty")
+    terminology = tables.get("terminology")
+    if terminology is not None:
+        _report(errors, "terminology", terminology, terminology[TERM] == "", "term to replace is empty")
+    return errors
+
+def plan(tables):
+    """
+    Turns validated tables into the arguments for database.bulk_provision().
+    Returns: (organization names, user dicts, {organization name: KB content}).
+    """
+    import pandas as pd
+
+    orgs = tables.get("orgs")
+    users = tables.get("users")
+    categories = tables.get("categories", pd.DataFrame(columns=SCHEMAS["categories"][0] + SCHEMAS["categories"][1]))
+    terminology = tables.get("terminology", pd.DataFrame(columns=SCHEMAS["terminology"][0]))
+
+    referenced = [df[ORGANIZATION] for df in (orgs, users, categories, terminology) if df is not None]
+    org_names = list(dict.fromkeys(pd.concat(referenced).tolist())) if referenced else []
+
+    user_records = []
+    if users is not None:
+        user_records = [
+            {"email": email, "name": name, "picture_url": picture_url, "org_name": org_name}
+            for email, name, picture_url, org_name in zip(
+                users["Email"].str.lower(), users["Name"], users["Picture URL"], users[ORGANIZATION]
+            )
+        ]
+
+    details = {}
+    if orgs is not None:
+        details = orgs.set_index(ORGANIZATION)[["Company Name", "Tone Rule"]].to_dict("index")
+    categories_by_org = dict(tuple(categories.groupby(ORGANIZATION)))
+    terminology_by_org = dict(tuple(terminology.groupby(ORGANIZATION)))
+    knowledge_bases = {}
+    for org_name in org_names:
+        if org_name not in categories_by_org and org_name not in terminology_by_org:
+            continue
+        org = details.get(org_name, {})
+        knowledge_bases[org_name] = build_kb(
+            org.get("Company Name") or org_name,
+            org.get("Tone Rule") or DEFAULT_TONE_RULE,
+            categories_by_org.get(org_name, categories.iloc[0:0]),
+            terminology_by_org.get(org_name, terminology.iloc[0:0]),
+        )
+    return org_names, user_records, knowledge_bases
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for kind in SCHEMAS:
+        parser.add_argument(f"--{kind}", help=f"CSV or JSON file of {kind}.")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and summarise without writing.")
+    args = parser.parse_args(argv)
+
+    try:
+        tables = {kind: load_table(getattr(args, kind), kind) for kind in SCHEMAS if getattr(args, kind)}
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not tables:
+        parser.error("nothing to import; pass at least one of --orgs, --users, --categories, --terminology")
+
+    errors = validate(tables)
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        print(f"{len(errors)} validation error(s); nothing was written.", file=sys.stderr)
+        return 1
+
+    org_names, users, knowledge_bases = plan(tables)
+    print(f"{len(org_names)} organization(s), {len(users)} user(s), {len(knowledge_bases)} knowledge base(s)")
+    if args.dry_run:
+        return 0
+
+    import database as db
+    db.setup_database()
+    result = db.bulk_provision(org_names, users, knowledge_bases)
+    if result is None:
+        print("Provisioning failed; the transaction was rolled back.", file=sys.stderr)
+        return 1
+    print(", ".join(f"{key.replace('_', ' ')}: {value}" for key, value in result.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
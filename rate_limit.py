@@ -0,0 +1,288 @@
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+import tracing
+from prompt_builder import estimate_tokens
+
+# Lower numbers are admitted first; ties are served in arrival order.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+THROTTLE_STATUS_CODES = {429, 503}
+THROTTLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable"}
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when a call waited longer than max_wait_seconds to be admitted."""
+
+def is_throttled(error):
+    """Checks whether an exception is a quota or overload error worth retrying after a pause."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    try:
+        if int(code) in THROTTLE_STATUS_CODES:
+            return True
+    except (TypeError, ValueError):
+        pass
+    return type(error).__name__ in THROTTLE_ERROR_NAMES
+
+def retry_hint(error):
+    """
+    Returns the server's suggested delay in seconds, or None if it gave none.
+    Looks at a retry_after attribute, a google.rpc RetryInfo in the error details,
+    a Retry-After response header and finally a "retry in Ns" message.
+    """
+    hint = getattr(error, "retry_after", None)
+    if hint is not None:
+        return float(hint)
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+    match = _RETRY_IN.search(str(error))
+    return float(match.group(1)) if match else None
+
+class TokenBucket:
+    """A bucket holding up to one minute's allowance, refilled continuously. Not thread-safe on its own."""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_seconds(self, amount):
+        """Seconds until `amount` can be taken; an amount above capacity only needs a full bucket."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    """
+    Process-wide admission control for model calls, shared by every session and worker thread.
+
+    A call is admitted when it reaches the head of a priority queue and the request and token
+    buckets both have room. In-flight calls are capped by an adaptive limit that starts at
+    min_concurrency, grows by one after each limit's worth of successes while others are queued,
+    and halves (once per pause) on throttling.
+    A throttled call pauses admission for everyone until the server's retry hint (or an
+    exponential backoff with jitter) has passed, then retries up to max_retries times.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=1_000_000, min_concurrency=1,
+                 max_concurrency=8, max_retries=5, base_backoff_seconds=1.0, max_backoff_seconds=60.0,
+                 max_wait_seconds=300.0, output_token_reserve=2048, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency_limit = self.min_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.output_token_reserve = output_token_reserve
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._stats = {
+            "admitted": 0, "throttled": 0, "retries": 0, "timeouts": 0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+        }
+
+    def _admission_delay(self, reserve):
+        """Seconds until the head of the queue may start, or None if it must wait for a release."""
+        if self._in_flight >= self.concurrency_limit:
+            return None
+        return max(
+            self._paused_until - self._clock(),
+            self.requests.wait_seconds(1),
+            self.tokens.wait_seconds(reserve),
+            0.0,
+        )
+
+    def acquire(self, reserve, priority=PRIORITY_NORMAL):
+        """
+        Blocks until a call reserving `reserve` tokens is admitted.
+        Raises: RateLimitTimeout after max_wait_seconds in the queue.
+        """
+        started = self._clock()
+        entry = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    delay = self._admission_delay(reserve) if self._queue[0] == entry else None
+                    if delay == 0.0:
+                        break
+                    remaining = self.max_wait_seconds - (self._clock() - started)
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise RateLimitTimeout(f"Model call not admitted within {self.max_wait_seconds:g}s")
+                    self._cond.wait(remaining if delay is None else min(delay, remaining))
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+            self.requests.take(1)
+            self.tokens.take(reserve)
+            self._in_flight += 1
+            waited = self._clock() - started
+            self._stats["admitted"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        if tracing.is_enabled():
+            tracing.observe("ai_rate_limit.wait", waited)
+
+    def release(self, reserve, used_tokens=None, throttled_error=None, attempt=0):
+        """
+        Ends an admitted call, returning unused reserved tokens and adapting the concurrency limit.
+        Returns: The backoff in seconds before a throttled call may be retried, else None.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.give(reserve - used_tokens)
+            delay = None
+            if throttled_error is not None:
+                self._stats["throttled"] += 1
+                self._successes = 0
+                if self._clock() >= self._paused_until:
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit // 2)
+                backoff = min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** attempt)
+                delay = max(retry_hint(throttled_error) or 0.0, random.uniform(backoff / 2, backoff))
+                self._paused_until = max(self._paused_until, self._clock() + delay)
+            elif self._queue and self.concurrency_limit < self.max_concurrency:
+                self._successes += 1
+                if self._successes >= self.concurrency_limit:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+        return delay
+
+    def _should_retry(self, error, attempt, produced=False):
+        if produced or not is_throttled(error) or attempt >= self.max_retries:
+            return False
+        with self._cond:
+            self._stats["retries"] += 1
+        return True
+
+    def call(self, fn, prompt_tokens, priority=PRIORITY_NORMAL):
+        """Runs fn() once admitted, retrying throttling errors; fn returns the response text."""
+        reserve = prompt_tokens + self.output_token_reserve
+        for attempt in itertools.count():
+            self.acquire(reserve, priority)
+            try:
+                text = fn()
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.release(reserve, throttled_error=e if throttled else None, attempt=attempt)
+                if not self._should_retry(e, attempt):
+                    raise
+                continue
+            self.release(reserve, prompt_tokens + estimate_tokens(text or ""))
+            return text
+
+    def stream(self, fn, prompt_tokens, priority=PRIORITY_NORMAL):
+        """
+        Yields the pieces of fn() once admitted. The slot is held until the stream ends, and a
+        throttling error is only retried if it happened before any text was produced.
+        """
+        reserve = prompt_tokens + self.output_token_reserve
+        for attempt in itertools.count():
+            self.acquire(reserve, priority)
+            output_tokens = 0
+            released = False
+            try:
+                for piece in fn():
+                    output_tokens += estimate_tokens(piece)
+                    yield piece
+            except Exception as e:
+                throttled = is_throttled(e)
+                released = True
+                self.release(reserve, throttled_error=e if throttled and not output_tokens else None, attempt=attempt)
+                if not self._should_retry(e, attempt, produced=output_tokens > 0):
+                    raise
+                continue
+            finally:
+                if not released:
+                    self.release(reserve, prompt_tokens + output_tokens)
+            return
+
+    async def call_async(self, fn, prompt_tokens, priority=PRIORITY_NORMAL):
+        """
+        Async variant of call(): fn() returns an awaitable; the wait for admission runs on a thread.
+        A call cancelled while queued hands its slot back as soon as that thread is admitted.
+        """
+        reserve = prompt_tokens + self.output_token_reserve
+
+        def release_once_admitted(admission):
+            if not admission.cancelled() and admission.exception() is None:
+                self.release(reserve)
+
+        for attempt in itertools.count():
+            # Shielded so cancelling the caller cannot orphan an acquire still running on its thread.
+            admission = asyncio.ensure_future(asyncio.to_thread(self.acquire, reserve, priority))
+            try:
+                await asyncio.shield(admission)
+            except asyncio.CancelledError:
+                admission.add_done_callback(release_once_admitted)
+                raise
+            try:
+                text = await fn()
+            except asyncio.CancelledError:
+                self.release(reserve)
+                raise
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.release(reserve, throttled_error=e if throttled else None, attempt=attempt)
+                if not self._should_retry(e, attempt):
+                    raise
+                continue
+            self.release(reserve, prompt_tokens + estimate_tokens(text or ""))
+            return text
+
+    def stats(self):
+        """Returns queue depth, in-flight calls, the current concurrency limit and wait-time counters."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                queue_depth=len(self._queue),
+                in_flight=self._in_flight,
+                concurrency_limit=self.concurrency_limit,
+                paused_seconds=max(self._paused_until - self._clock(), 0.0),
+                requests_available=self.requests.level,
+                tokens_available=self.tokens.level,
+            )
+        admitted = stats["admitted"]
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / admitted if admitted else 0.0
+        return stats
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "ai_responses.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def normalize_prompt(prompt):
+    """Normalizes line endings and trailing whitespace so cosmetic differences share a cache entry."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+def make_cache_key(model_name, params, prompt):
+    """Returns the content address of a model call: a SHA-256 of the model, its parameters and the prompt."""
+    material = json.dumps(
+        {"model": model_name, "params": params or {}, "prompt": normalize_prompt(prompt)},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Persistent, size-bounded cache of model responses stored in a local SQLite file.
+    Least recently used entries are evicted once the stored responses exceed max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "hit_seconds_total": 0.0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);")
+
+    def _connection(self):
+        """Returns this thread's SQLite connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Returns the cached response for a key, or None on a miss."""
+        started = time.perf_counter()
+        conn = self._connection()
+        row = conn.execute("SELECT response FROM responses WHERE key = ?;", (key,)).fetchone()
+        if row is None:
+            with self._stats_lock:
+                self._stats["misses"] += 1
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?;", (time.time(), key))
+        with self._stats_lock:
+            self._stats["hits"] += 1
+            self._stats["hit_seconds_total"] += time.perf_counter() - started
+        return row[0]
+
+    def put(self, key, response):
+        """Stores a response and evicts least recently used entries beyond the size bound."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._write_lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?);",
+                (key, response, size, now, now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses;").fetchone()[0]
+            victims = []
+            if total > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size FROM responses WHERE key != ? ORDER BY last_access;", (key,)
+                )
+                for victim_key, victim_size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((victim_key,))
+                    total -= victim_size
+                conn.executemany("DELETE FROM responses WHERE key = ?;", victims)
+            evicted = len(victims)
+        with self._stats_lock:
+            self._stats["writes"] += 1
+            self._stats["evictions"] += evicted
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the average hit latency."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["hit_ms_avg"] = 1000 * stats["hit_seconds_total"] / stats["hits"] if stats["hits"] else 0.0
+        return stats
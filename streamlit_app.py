@@ -1,10 +1,11 @@
 import streamlit as st
-import pandas as pd
-import json
 
 # Import modular components and utilities
 import database as db
-from utils import load_local_css, parse_csv, call_ai, generate_docx
+import tracing
+import warmup
+from utils import load_local_css, iter_upload_records, generate_docx
+from jobs import start_workers, POLL_SECONDS as JOB_POLL_SECONDS
 from kb_wizard import show_kb_wizard
 from auth import show_login_button, process_auth_code
 
@@ -28,6 +29,24 @@ def show_new_user_registration(auth_info):
             st.warning("Please enter an organization name.")
     st.markdown('</div>', unsafe_allow_html=True)
 
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_generation_job(job_id):
+    """Polls a background generation job, showing its progress and partial output until it finishes."""
+    job = db.get_generation_job(job_id)
+    if not job:
+        return
+    if job["status"] == "succeeded":
+        st.session_state.generated_notes = job["result"]
+        st.rerun()
+    elif job["status"] == "failed":
+        st.session_state.generation_job_id = None
+        st.session_state.generation_error = job["error"]
+        st.rerun()
+    else:
+        st.progress(job["progress"], text=job["progress_message"] or "Waiting for a worker...")
+        if job["result"]:
+            st.markdown(job["result"])
+
 def show_main_application():
     """Renders the main application UI."""
     user = st.session_state.user
@@ -51,20 +70,29 @@ def show_main_application():
     
     if st.button("Generate Release Notes", type="primary", use_container_width=True):
         if any(uploaded_files.values()):
-            with st.spinner("Analyzing data and generating notes..."):
-                kb = db.get_kb_for_organization(user['org_id'])
-                csv_data = {key: parse_csv(file) for key, file in uploaded_files.items() if file}
-                prompt = "Generate release notes from the following CSV data..."
-                full_prompt = f"{prompt}\n\nKnowledge Base:\n{json.dumps(kb, indent=2)}\n\nCSV Data:\n{json.dumps(csv_data, indent=2)}"
-                release_notes_md = call_ai(full_prompt)
-                st.session_state.generated_notes = release_notes_md
+            with st.spinner("Reading your CSV files..."):
+                files = {key: file for key, file in uploaded_files.items() if file}
+                job_id = db.enqueue_generation_job(user['org_id'], user['id'], {"sources": list(files)}, iter_upload_records(files))
+            if job_id:
+                st.session_state.generation_job_id = job_id
+                st.session_state.generated_notes = None
         else:
             st.warning("Please upload at least one CSV file.")
 
+    # Pick up the user's latest job after a reconnect, when this session has no job of its own.
+    if "generation_job_id" not in st.session_state:
+        latest_job = db.get_latest_generation_job(user['id'])
+        st.session_state.generation_job_id = latest_job["id"] if latest_job else None
+    if st.session_state.get("generation_error"):
+        st.error(f"Release note generation failed: {st.session_state.pop('generation_error')}")
+    if st.session_state.generation_job_id and not st.session_state.get("generated_notes"):
+        show_generation_job(st.session_state.generation_job_id)
+
     if "generated_notes" in st.session_state and st.session_state.generated_notes:
         st.subheader("Generated Release Notes")
         st.markdown("---")
-        docx_bytes = generate_docx(st.session_state.generated_notes)
+        st.markdown(st.session_state.generated_notes)
+        docx_bytes = generate_docx(f"{user['org_name']} Release Notes", st.session_state.generated_notes)
         st.download_button(
             label="Download Release Notes (.docx)",
             data=docx_bytes,
@@ -82,6 +110,9 @@ def main():
     if "app_state" not in st.session_state:
         st.session_state.app_state = "login"
 
+    user = st.session_state.get("user") or {}
+    tracing.set_labels(org=user.get("org_id"), user=user.get("id"))
+
     # --- State Machine ---
     
     # State 1: Handle Auth0 redirect
@@ -140,8 +171,19 @@ def main():
 
 if __name__ == "__main__":
     try:
+        tracing.set_enabled(tracing.parse_flag(st.secrets.get("TRACING_ENABLED", tracing.is_enabled())))
+        if st.secrets.get("METRICS_PORT"):
+            tracing.start_metrics_server(int(st.secrets["METRICS_PORT"]))
         db.setup_database()
-        main()
+        start_workers()
+        # With PROFILING_ENABLED set, append ?profile=1 to the URL to cProfile the next script run only.
+        profile = tracing.parse_flag(st.secrets.get("PROFILING_ENABLED", False)) and st.query_params.get("profile") == "1"
+        if profile:
+            del st.query_params["profile"]
+        with tracing.profile_request("streamlit_run", enabled=profile):
+            main()
+        # The page is on screen now; load what later steps need while the user reads it.
+        warmup.start_warmup()
     except Exception as e:
         st.error("A critical error occurred. Please see the details below.")
         st.exception(e)
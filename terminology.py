@@ -0,0 +1,68 @@
+import functools
+import json
+import re
+
+from text_matching import build_terms_pattern
+
+_INLINE_CODE = r"(`[^`\n]*`)"
+
+class TerminologyReplacer:
+    """
+    Applies a KB's terminology_rules to generated markdown in a single pass.
+    Terms match case-insensitively on word boundaries (an exact-case rule wins over a differently cased one)
+    and are replaced with the correct term verbatim. Inline code and fenced code blocks are left untouched.
+    """
+
+    def __init__(self, rules):
+        self._exact = {}
+        self._folded = {}
+        for term, replacement in rules.items():
+            term = str(term or "").strip()
+            if term and replacement is not None and str(replacement).strip():
+                self._exact[term] = str(replacement).strip()
+                self._folded.setdefault(term.lower(), str(replacement).strip())
+        terms_pattern = build_terms_pattern(self._exact)
+        self.pattern = re.compile(f"{_INLINE_CODE}|{terms_pattern.pattern}", terms_pattern.flags) if terms_pattern else None
+
+    def _replace(self, match):
+        if match.group(1):
+            return match.group(1)
+        found = match.group(0)
+        return self._exact.get(found) or self._folded[found.lower()]
+
+    def _apply_line(self, line, state):
+        if line.lstrip().startswith("```"):
+            state["in_fence"] = not state["in_fence"]
+            return line
+        if state["in_fence"]:
+            return line
+        return self.pattern.sub(self._replace, line)
+
+    def stream(self, pieces):
+        """Applies the rules to streamed text, yielding each line as soon as it is complete."""
+        if self.pattern is None:
+            yield from pieces
+            return
+        state = {"in_fence": False}
+        buffer = ""
+        for piece in pieces:
+            buffer += piece
+            if "\n" not in buffer:
+                continue
+            complete, buffer = buffer.rsplit("\n", 1)
+            yield "".join(self._apply_line(line, state) + "\n" for line in complete.split("\n"))
+        if buffer:
+            yield self._apply_line(buffer, state)
+
+    def apply(self, text):
+        """Returns the text with every terminology rule applied."""
+        return "".join(self.stream([text]))
+
+@functools.lru_cache(maxsize=32)
+def _compile_replacer(rules_json):
+    return TerminologyReplacer(json.loads(rules_json))
+
+def get_replacer(kb):
+    """Returns the compiled replacer for a KB's terminology_rules, cached for as long as the rules are unchanged."""
+    rules = ((kb or {}).get("writing_style_guide") or {}).get("terminology_rules") or {}
+    return _compile_replacer(json.dumps(rules, sort_keys=True))
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from classification import KeywordClassifier
+from generation import UNCATEGORIZED, partition_rows
+
+CATEGORIES = {
+    "Platform": {"description": "Infrastructure.", "keywords_and_aliases": ["performance", "upgrade"]},
+    "UI/UX": {"description": "Interface.", "keywords_and_aliases": ["design", "frontend"]},
+}
+
+def test_unmatched_rows_are_none():
+    rows = [
+        {"Summary": "Fix typo in the docs"},
+        {"Summary": "Tidy internal scripts"},
+        {"Summary": "Performance upgrade for search"},
+    ]
+    assert KeywordClassifier(CATEGORIES).classify(rows) == [None, None, "Platform"]
+
+def test_no_matches_at_all_are_none():
+    assert KeywordClassifier(CATEGORIES).classify([{"Summary": "nothing"}, {"Summary": "here"}]) == [None, None]
+
+def test_unmatched_rows_are_partitioned_as_uncategorized():
+    csv_data = {"stories": [{"Summary": "Fix typo"}, {"Summary": "New frontend design"}]}
+    chunks = partition_rows(csv_data, classifier=KeywordClassifier(CATEGORIES))
+    assert len(chunks) == 1
+    assert sorted(row["Category"] for row in chunks[0]["rows"]) == sorted([UNCATEGORIZED, "UI/UX"])
+    assert "Category" not in csv_data["stories"][0]
+
+def test_large_categories_span_chunks_and_small_ones_share():
+    rows = [{"Summary": f"Frontend design change {i}"} for i in range(6)] + [{"Summary": "Performance fix"}, {"Summary": "Typo"}]
+    chunks = partition_rows({"stories": rows}, max_chunk_tokens=30, classifier=KeywordClassifier(CATEGORIES))
+    categories = [[row["Category"] for row in chunk["rows"]] for chunk in chunks]
+    assert [category for chunk in categories for category in chunk] == ["UI/UX"] * 6 + ["Platform", UNCATEGORIZED]
+    assert len(chunks) < len(rows)
+    assert all(chunk["tokens"] <= 30 for chunk in chunks if len(chunk["rows"]) > 1)
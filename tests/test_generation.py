@@ -0,0 +1,52 @@
+from generation import _collect_row_notes, categories_fingerprint, generate_release_notes, row_identity
+
+def test_row_notes_are_unique_per_source_and_key():
+    keyless_key = row_identity({"Summary": "Same change"})[0]
+    chunks = [
+        {"source": "stories", "rows": [{"Category": "A", "Issue key": "S-1", "Summary": "a"}, {"Category": "A", "Issue key": "S-1", "Summary": "b"}]},
+        {"source": "stories", "rows": [{"Category": "B", "Summary": "Same change"}, {"Category": "B", "Summary": "Same change"}]},
+        {"source": "fixes", "rows": [{"Category": "A", "Issue key": "S-1", "Summary": "a"}]},
+    ]
+    summaries = ["- [S-1] First note", f"- [{keyless_key}] Second note", "- [S-1] Fix note"]
+    notes = _collect_row_notes(chunks, summaries)
+    assert len(notes) == 3
+    assert {(n["source"], n["row_key"]) for n in notes} == {
+        ("fixes", "S-1"), ("stories", "S-1"), ("stories", keyless_key),
+    }
+    assert next(n for n in notes if n["source"] == "stories" and n["row_key"] == "S-1")["fingerprint"] == \
+        row_identity({"Issue key": "S-1", "Summary": "b"})[1]
+
+def test_rows_that_fit_one_prompt_take_one_call():
+    prompts = []
+    def model_fn(prompt):
+        prompts.append(prompt)
+        return "- note"
+    csv_data = {
+        "stories": [{"Issue key": f"S-{i}", "Summary": f"Change {i}", "Component/s": f"C{i % 20}"} for i in range(100)],
+        "fixes": [{"Issue key": f"F-{i}", "Summary": f"Fix {i}", "Component/s": "C1"} for i in range(10)],
+    }
+    assert generate_release_notes({}, csv_data, model_fn=model_fn) == "- note"
+    assert len(prompts) == 1
+    assert "S-99" in prompts[0] and "F-9" in prompts[0]
+
+def test_small_incremental_run_takes_one_call_and_strips_keys():
+    kb = {"company_name": "Acme"}
+    fingerprint = categories_fingerprint(kb)
+    unchanged = {"Issue key": "S-1", "Summary": "Old change", "Component/s": "Search"}
+    prior = {("stories", "S-1"): {"fingerprint": row_identity(unchanged, fingerprint)[1], "category": "Search", "note": "Old note"}}
+    prompts, saved = [], []
+    def model_fn(prompt):
+        prompts.append(prompt)
+        return "## Search\n- [S-1] Old note\n- [S-2] New note\n"
+    csv_data = {"stories": [unchanged, {"Issue key": "S-2", "Summary": "New change", "Component/s": "Search"}]}
+    notes = generate_release_notes(kb, csv_data, model_fn=model_fn, prior_notes=prior, notes_fn=saved.extend)
+    assert len(prompts) == 1
+    assert notes == "## Search\n- Old note\n- New note\n"
+    assert [(n["row_key"], n["category"], n["note"]) for n in saved] == [("S-2", "Search", "New note")]
+
+def test_category_edits_change_the_fingerprint():
+    row = {"Issue key": "S-1", "Summary": "Change"}
+    before = categories_fingerprint({"product_categories": {"Search": {"keywords_and_aliases": ["find"]}}})
+    after = categories_fingerprint({"product_categories": {"Search": {"keywords_and_aliases": ["find", "query"]}}})
+    assert row_identity(row, before)[0] == row_identity(row, after)[0]
+    assert row_identity(row, before)[1] != row_identity(row, after)[1]
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("jose")
+pytest.importorskip("rsa")
+
+from bench.fakes import FakeThrottled
+from rate_limit import RateLimiter, RateLimitTimeout, PRIORITY_HIGH, PRIORITY_LOW
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+def test_retry_hint_pauses_admission_for_everyone():
+    clock = FakeClock()
+    limiter = RateLimiter(max_concurrency=4, base_backoff_seconds=0.0, max_wait_seconds=0.0, clock=clock)
+    limiter.acquire(100)
+    assert limiter.release(100, throttled_error=FakeThrottled(30)) == 30
+    assert limiter.stats()["paused_seconds"] == 30
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(100)
+    clock.now = 30
+    limiter.acquire(100)
+    assert limiter.stats()["in_flight"] == 1
+
+def test_throttling_halves_the_concurrency_limit_once_per_pause():
+    clock = FakeClock()
+    limiter = RateLimiter(min_concurrency=1, max_concurrency=8, base_backoff_seconds=0.0, clock=clock)
+    limiter.concurrency_limit = 8
+    for _ in range(3):
+        limiter.acquire(10)
+    limiter.release(10, throttled_error=FakeThrottled(5))
+    limiter.release(10, throttled_error=FakeThrottled(5))
+    assert limiter.concurrency_limit == 4
+    clock.now = 5
+    limiter.release(10, throttled_error=FakeThrottled(5))
+    assert limiter.concurrency_limit == 2
+
+def test_call_retries_throttling_then_gives_up():
+    limiter = RateLimiter(max_retries=2, base_backoff_seconds=0.0, clock=FakeClock())
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FakeThrottled(0)
+        return "ok"
+
+    assert limiter.call(flaky, 10) == "ok"
+
+    def always_throttled():
+        raise FakeThrottled(0)
+
+    with pytest.raises(FakeThrottled):
+        limiter.call(always_throttled, 10)
+    stats = limiter.stats()
+    assert (stats["throttled"], stats["retries"], stats["in_flight"]) == (4, 3, 0)
+
+def test_higher_priority_calls_are_admitted_first():
+    limiter = RateLimiter(min_concurrency=1, max_concurrency=1)
+    limiter.acquire(10)
+    order = []
+
+    def waiter(name, priority):
+        limiter.acquire(10, priority)
+        order.append(name)
+        limiter.release(10, 10)
+
+    low = threading.Thread(target=waiter, args=("low", PRIORITY_LOW))
+    low.start()
+    _wait_for(lambda: limiter.stats()["queue_depth"] == 1)
+    high = threading.Thread(target=waiter, args=("high", PRIORITY_HIGH))
+    high.start()
+    _wait_for(lambda: limiter.stats()["queue_depth"] == 2)
+    limiter.release(10, 10)
+    low.join(5)
+    high.join(5)
+    assert order == ["high", "low"]
+
+def test_timeout_when_no_slot_frees_up():
+    limiter = RateLimiter(max_concurrency=1, max_wait_seconds=0.0, clock=FakeClock())
+    limiter.acquire(10)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(10)
+    stats = limiter.stats()
+    assert (stats["timeouts"], stats["queue_depth"], stats["in_flight"]) == (1, 0, 1)
+
+def test_cancelled_async_call_gives_back_its_slot():
+    limiter = RateLimiter(min_concurrency=1, max_concurrency=1)
+    limiter.acquire(10)
+
+    async def answer():
+        return "ok"
+
+    async def main():
+        task = asyncio.create_task(limiter.call_async(answer, 10))
+        while limiter.stats()["queue_depth"] == 0:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter.release(10, 10)
+        for _ in range(1000):
+            if limiter.stats()["admitted"] == 2 and limiter.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.005)
+
+    asyncio.run(main())
+    stats = limiter.stats()
+    assert (stats["admitted"], stats["in_flight"]) == (2, 0)
@@ -0,0 +1,33 @@
+import re
+
+def _trie_to_pattern(node):
+    """Renders one trie node as a regex fragment; the "" key marks the end of a term."""
+    optional = "" in node
+    alternatives = [re.escape(char) + _trie_to_pattern(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1 and not optional:
+        return alternatives[0]
+    group = "(?:" + "|".join(alternatives) + ")"
+    return group + "?" if optional else group
+
+def build_terms_pattern(terms, ignore_case=True):
+    """
+    Compiles any number of literal terms into one regex built from a character trie, so shared
+    prefixes are matched once and a single linear scan finds every term. Matches prefer the longest
+    term and must not touch a word character on either side.
+    Returns: The compiled pattern, or None if there are no non-empty terms.
+    """
+    trie = {}
+    for term in terms:
+        term = term.strip()
+        if not term:
+            continue
+        node = trie
+        for char in (term.lower() if ignore_case else term):
+            node = node.setdefault(char, {})
+        node[""] = {}
+    if not trie:
+        return None
+    body = _trie_to_pattern(trie)
+    return re.compile(rf"(?<!\w)(?:{body})(?!\w)", re.IGNORECASE if ignore_case else 0)
@@ -0,0 +1,203 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "docsplain"
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, float("inf"))
+PROFILE_DIR = os.path.join(".cache", "profiles")
+# Only the newest profiles are kept; older .prof files are deleted as new ones are written.
+PROFILE_KEEP = 20
+
+def parse_flag(value):
+    """Reads an on/off setting the way DOCSPLAIN_TRACING is read: "1", "true" or "yes" (any case) mean on."""
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+_enabled = parse_flag(os.environ.get("DOCSPLAIN_TRACING", ""))
+_labels = contextvars.ContextVar("tracing_labels", default={})
+_histograms = {}
+_histograms_lock = threading.Lock()
+_collectors = {}
+_metrics_server = None
+
+def set_enabled(enabled):
+    """Turns stage timing on or off for the whole process."""
+    global _enabled
+    _enabled = bool(enabled)
+
+def is_enabled():
+    return _enabled
+
+def set_labels(**labels):
+    """Sets the labels (e.g. org, user) attached to stages timed in the current context."""
+    _labels.set({key: str(value) for key, value in labels.items() if value is not None})
+
+def observe(stage, seconds, labels=None):
+    """Records one duration for a stage in its in-process histogram."""
+    key = (stage, tuple(sorted((labels if labels is not None else _labels.get()).items())))
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage):
+    """Returns a context manager timing a stage; a shared no-op object when tracing is disabled."""
+    return _Span(stage) if _enabled else _NOOP_SPAN
+
+def traced(stage):
+    """
+    Decorator timing every call of a function as a stage. Generator functions are timed until the
+    generator is exhausted. With tracing disabled the only overhead is one flag check per call.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from fn(*args, **kwargs))
+                with _Span(stage):
+                    return (yield from fn(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def register_collector(name, collect):
+    """Registers a function returning a dict of numbers, exported as gauges named <prefix>_<name>_<key>."""
+    _collectors[name] = collect
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+def render_prometheus():
+    """Renders stage histograms and registered collectors in the Prometheus text exposition format."""
+    metric = f"{METRIC_PREFIX}_stage_seconds"
+    lines = [f"# HELP {metric} Latency of request-path stages.", f"# TYPE {metric} histogram"]
+    with _histograms_lock:
+        snapshot = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in _histograms.items()}
+    for (stage, labels), histogram in sorted(snapshot.items()):
+        base = (("stage", stage),) + labels
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{metric}_bucket{{{_format_labels(base + (('le', le),))}}} {cumulative}")
+        lines.append(f"{metric}_sum{{{_format_labels(base)}}} {histogram['sum']}")
+        lines.append(f"{metric}_count{{{_format_labels(base)}}} {histogram['count']}")
+    for name, collect in sorted(_collectors.items()):
+        try:
+            values = collect() or {}
+        except Exception:
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_{key} gauge")
+                lines.append(f"{METRIC_PREFIX}_{name}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Clears every recorded histogram."""
+    with _histograms_lock:
+        _histograms.clear()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serves render_prometheus() over HTTP on a background thread (once per process)."""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _metrics_server
+
+def _prune_profiles():
+    paths = [entry.path for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".prof")]
+    for path in sorted(paths, key=os.path.getmtime)[:-PROFILE_KEEP]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+@contextmanager
+def profile_request(label, enabled=True, top=25):
+    """
+    Profiles the enclosed block with cProfile when enabled, saving the raw stats under PROFILE_DIR
+    (keeping the newest PROFILE_KEEP files) and logging the top functions by cumulative time.
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{label}-{int(time.time())}.prof")
+        profiler.dump_stats(path)
+        _prune_profiles()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+        logger.info("Profile for %s saved to %s\n%s", label, path, report.getvalue())
@@ -1,10 +1,47 @@
 import streamlit as st
-import pandas as pd
-import requests
-import google.generativeai as genai
-from docx import Document
-from docx.shared import Inches
 import io
+import re
+import threading
+import time
+import tracing
+from prompt_builder import estimate_tokens
+from rate_limit import RateLimiter, PRIORITY_HIGH, PRIORITY_NORMAL
+from response_cache import ResponseCache, make_cache_key, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+
+# Jira export columns the release-notes prompt uses; everything else in the export is skipped.
+CSV_COLUMNS = [
+    "Issue key", "Issue Type", "Summary", "Description", "Status", "Priority", "Resolution",
+    "Component/s", "Labels", "Fix Version/s", "Epic Link", "Epic Name", "Parent", "Parent summary",
+]
+CSV_CHUNK_ROWS = 5000
+CSV_MAX_FIELD_CHARS = 2000
+
+GEMINI_MODEL = 'gemini-1.5-flash-latest'
+# Passed to GenerativeModel as generation_config and folded into every response cache key.
+GENERATION_PARAMS = {}
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+_model = None
+_model_lock = threading.Lock()
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+_ai_latency = {
+    "calls": 0,
+    "streamed_calls": 0,
+    "first_token_seconds_total": 0.0,
+    "first_token_seconds_max": 0.0,
+    "total_seconds_total": 0.0,
+    "total_seconds_max": 0.0,
+}
+_ai_latency_lock = threading.Lock()
+
+tracing.register_collector("ai_cache", lambda: _response_cache.stats() if _response_cache else {})
+tracing.register_collector("ai_latency", lambda: get_ai_latency_stats())
+tracing.register_collector("ai_rate_limit", lambda: _rate_limiter.stats() if _rate_limiter else {})
 
 def load_local_css(file_name):
     """Loads a local CSS file into the Streamlit app."""
@@ -14,39 +51,335 @@ def load_local_css(file_name):
     except FileNotFoundError:
         st.warning(f"CSS file not found: {file_name}")
 
-def parse_csv(uploaded_file):
-    """Parses an uploaded CSV file and returns a pandas DataFrame."""
-    try:
-        return pd.read_csv(uploaded_file)
-    except Exception as e:
-        st.error(f"Error parsing CSV file: {e}")
-        return pd.DataFrame()
+def _normalize_column_name(name):
+    """Strips whitespace and the ".1", ".2" suffixes pandas adds to repeated Jira columns."""
+    return re.sub(r"\.\d+$", "", str(name).strip())
+
+def iter_csv_records(uploaded_file, columns=CSV_COLUMNS, chunksize=CSV_CHUNK_ROWS):
+    """
+    Streams an uploaded CSV as compact row dictionaries, one chunk of rows at a time.
+    Only the columns the prompt needs are read (all columns if none of them are present),
+    repeated columns such as Labels are merged, whitespace is collapsed, long text is truncated
+    and empty fields are dropped, so peak memory depends on the chunk size rather than the file size.
+    """
+    import pandas as pd
+
+    wanted = {c.lower() for c in columns}
+    header = pd.read_csv(uploaded_file, nrows=0).columns
+    uploaded_file.seek(0)
+    usecols = [c for c in header if _normalize_column_name(c).lower() in wanted] or list(header)
+
+    reader = pd.read_csv(
+        uploaded_file, usecols=usecols, dtype=str, keep_default_na=False,
+        chunksize=chunksize, on_bad_lines="skip"
+    )
+    for chunk in reader:
+        chunk = chunk.apply(lambda col: col.str.replace(r"\s+", " ", regex=True).str.strip().str.slice(0, CSV_MAX_FIELD_CHARS))
+        compact = pd.DataFrame(index=chunk.index)
+        names = pd.Index([_normalize_column_name(c) for c in chunk.columns])
+        for name in names.unique():
+            group = chunk.loc[:, names == name]
+            if group.shape[1] == 1:
+                compact[name] = group.iloc[:, 0]
+            else:
+                stacked = group.replace("", pd.NA).stack().dropna()
+                compact[name] = stacked.groupby(level=0).agg(", ".join).reindex(chunk.index, fill_value="")
+        compact = compact.loc[:, compact.ne("").any()]
+        for record in compact.to_dict("records"):
+            yield {key: value for key, value in record.items() if value}
+
+@tracing.traced("parse_csv")
+def iter_upload_records(uploaded_files):
+    """
+    Streams (source, row_key, record) tuples from uploaded CSV files as iter_csv_records() parses them,
+    for database.enqueue_generation_job() to write in batches, so no upload is ever held in memory whole.
+    A file that fails to parse is reported and keeps only the rows read before the error.
+    """
+    from generation import row_identity
+
+    for source, uploaded_file in uploaded_files.items():
+        try:
+            for record in iter_csv_records(uploaded_file):
+                yield source, row_identity(record)[0], record
+        except Exception as e:
+            st.error(f"Error parsing CSV file: {e}")
+
+def get_response_cache():
+    """Returns the process-wide model response cache, or None when AI_CACHE_ENABLED is off."""
+    global _response_cache
+    if not st.secrets.get("AI_CACHE_ENABLED", True):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    path=st.secrets.get("AI_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    max_bytes=int(st.secrets.get("AI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                )
+    return _response_cache
+
+def get_ai_cache_stats():
+    """Returns hit/miss counters for the model response cache (empty when caching is disabled)."""
+    cache = get_response_cache()
+    return cache.stats() if cache else {}
+
+def _cache_bypassed(org_id):
+    """Checks whether an organization has opted out of response caching via AI_CACHE_BYPASS_ORGS."""
+    return org_id is not None and str(org_id) in {str(o) for o in st.secrets.get("AI_CACHE_BYPASS_ORGS", [])}
+
+def get_model():
+    """Returns the process-wide Gemini model client, configuring the SDK on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+
+                # The application will read the Gemini API key from your secrets.toml file
+                genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+                _model = genai.GenerativeModel(GEMINI_MODEL, generation_config=GENERATION_PARAMS or None)
+    return _model
+
+def get_rate_limiter():
+    """Returns the process-wide limiter that every Gemini call in this process goes through."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(
+                    requests_per_minute=float(st.secrets.get("AI_REQUESTS_PER_MINUTE", 60)),
+                    tokens_per_minute=float(st.secrets.get("AI_TOKENS_PER_MINUTE", 1_000_000)),
+                    min_concurrency=int(st.secrets.get("AI_MIN_CONCURRENCY", 1)),
+                    max_concurrency=int(st.secrets.get("AI_MAX_CONCURRENCY", 8)),
+                    max_retries=int(st.secrets.get("AI_THROTTLE_RETRIES", 5)),
+                    max_wait_seconds=float(st.secrets.get("AI_MAX_QUEUE_SECONDS", 300)),
+                )
+    return _rate_limiter
+
+def get_rate_limit_stats():
+    """Returns queue depth, in-flight calls and admission wait times of the model rate limiter."""
+    return get_rate_limiter().stats()
 
-def call_ai(prompt):
+def _record_ai_latency(first_token_seconds, total_seconds, streamed):
+    with _ai_latency_lock:
+        _ai_latency["calls"] += 1
+        _ai_latency["streamed_calls"] += int(streamed)
+        _ai_latency["first_token_seconds_total"] += first_token_seconds
+        _ai_latency["first_token_seconds_max"] = max(_ai_latency["first_token_seconds_max"], first_token_seconds)
+        _ai_latency["total_seconds_total"] += total_seconds
+        _ai_latency["total_seconds_max"] = max(_ai_latency["total_seconds_max"], total_seconds)
+
+def get_ai_latency_stats():
+    """Returns time-to-first-token and total latency of model calls (cache hits excluded)."""
+    with _ai_latency_lock:
+        stats = dict(_ai_latency)
+    calls = stats["calls"]
+    stats["first_token_seconds_avg"] = stats["first_token_seconds_total"] / calls if calls else 0.0
+    stats["total_seconds_avg"] = stats["total_seconds_total"] / calls if calls else 0.0
+    return stats
+
+def _cache_lookup(prompt, org_id):
+    """Returns (cache, key, cached_text) for a prompt; cache is None when caching does not apply."""
+    cache = None if _cache_bypassed(org_id) else get_response_cache()
+    if not cache:
+        return None, None, None
+    key = make_cache_key(GEMINI_MODEL, GENERATION_PARAMS, prompt)
+    return cache, key, cache.get(key)
+
+@tracing.traced("call_ai")
+def generate_text(prompt, org_id=None, priority=PRIORITY_NORMAL):
+    """
+    Calls the Gemini AI with a prompt and returns the response text, raising on any API error.
+    Identical model/parameter/prompt combinations are answered from the response cache;
+    everything else waits its turn in the shared rate limiter, which retries throttling errors.
+    """
+    cache, key, cached = _cache_lookup(prompt, org_id)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    text = get_rate_limiter().call(
+        lambda: get_model().generate_content(prompt).text, estimate_tokens(prompt), priority
+    )
+    elapsed = time.perf_counter() - started
+    _record_ai_latency(elapsed, elapsed, streamed=False)
+    if cache:
+        cache.put(key, text)
+    return text
+
+def _stream_pieces(prompt):
+    for chunk in get_model().generate_content(prompt, stream=True):
+        text = chunk.text if chunk.parts else ""
+        if text:
+            yield text
+
+@tracing.traced("call_ai.stream")
+def stream_text(prompt, org_id=None, priority=PRIORITY_HIGH):
+    """
+    Yields the Gemini response text piece by piece as it is generated, raising on any API error.
+    A cached response is yielded in one piece; a completed stream is written to the cache.
+    Streams default to high priority because they produce the document a user is watching.
+    """
+    cache, key, cached = _cache_lookup(prompt, org_id)
+    if cached is not None:
+        yield cached
+        return
+    started = time.perf_counter()
+    first_token_seconds = None
+    parts = []
+    for text in get_rate_limiter().stream(lambda: _stream_pieces(prompt), estimate_tokens(prompt), priority):
+        if first_token_seconds is None:
+            first_token_seconds = time.perf_counter() - started
+        parts.append(text)
+        yield text
+    total_seconds = time.perf_counter() - started
+    _record_ai_latency(first_token_seconds if first_token_seconds is not None else total_seconds, total_seconds, streamed=True)
+    if cache:
+        cache.put(key, "".join(parts))
+
+async def _generate_async(prompt):
+    response = await get_model().generate_content_async(prompt)
+    return response.text
+
+async def generate_text_async(prompt, org_id=None, priority=PRIORITY_NORMAL):
+    """Async variant of generate_text() for callers that issue many model calls concurrently."""
+    cache, key, cached = _cache_lookup(prompt, org_id)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    text = await get_rate_limiter().call_async(lambda: _generate_async(prompt), estimate_tokens(prompt), priority)
+    elapsed = time.perf_counter() - started
+    _record_ai_latency(elapsed, elapsed, streamed=False)
+    if cache:
+        cache.put(key, text)
+    return text
+
+def call_ai(prompt, org_id=None):
     """Calls the Gemini AI with a prompt and returns the response."""
     try:
-        # The application will read the Gemini API key from your secrets.toml file
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        response = model.generate_content(prompt)
-        return response.text
+        return generate_text(prompt, org_id, priority=PRIORITY_HIGH)
     except Exception as e:
         st.error(f"An error occurred with the Gemini API: {e}")
         return f"Error: {e}"
 
-def generate_docx(title, content):
-    """Generates a .docx file from markdown-like text content."""
+# One pass classifies each markdown line; the named group that matched decides the block type.
+_MD_BLOCK = re.compile(
+    r"^(?:(?P<fence>\s*```)"
+    r"|(?P<rule>\s*(?:-{3,}|\*{3,}|_{3,})\s*$)"
+    r"|(?P<heading>#{1,6})\s+"
+    r"|(?P<bullet>\s*)[*+-]\s+"
+    r"|(?P<number>\s*)\d+[.)]\s+"
+    r"|(?P<quote>>)\s?"
+    r"|(?P<table>\s*\|))"
+)
+_MD_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$")
+_MD_INLINE = re.compile(
+    r"\*\*\*(?P<bold_italic>.+?)\*\*\*"
+    r"|\*\*(?P<bold>.+?)\*\*|__(?P<bold2>.+?)__"
+    r"|\*(?P<italic>[^*\s](?:.*?[^*\s])??)\*|(?<!\w)_(?P<italic2>[^_\s](?:.*?[^_\s])??)_(?!\w)"
+    r"|`(?P<code>[^`]+)`"
+)
+CODE_FONT = "Courier New"
+
+def _add_inline_runs(paragraph, text):
+    """Adds text to a paragraph as runs, turning markdown bold/italic/code spans into run formatting."""
+    position = 0
+    for match in _MD_INLINE.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()])
+        kind = match.lastgroup
+        run = paragraph.add_run(match.group(kind))
+        run.bold = kind in ("bold", "bold2", "bold_italic")
+        run.italic = kind in ("italic", "italic2", "bold_italic")
+        if kind == "code":
+            run.font.name = CODE_FONT
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:])
+    return paragraph
+
+def _add_table(doc, rows):
+    """Adds a markdown table (header row first, separator rows already removed) as a grid table."""
+    cells = [[cell.strip() for cell in row.strip().strip("|").split("|")] for row in rows]
+    columns = max(len(row) for row in cells)
+    table = doc.add_table(rows=len(cells), cols=columns)
+    table.style = "Table Grid"
+    for row_index, row in enumerate(cells):
+        for column_index, text in enumerate(row):
+            paragraph = table.cell(row_index, column_index).paragraphs[0]
+            _add_inline_runs(paragraph, text)
+            if row_index == 0:
+                for run in paragraph.runs:
+                    run.bold = True
+
+def _add_code_block(doc, lines):
+    paragraph = doc.add_paragraph(style="No Spacing")
+    run = paragraph.add_run("\n".join(lines))
+    run.font.name = CODE_FONT
+
+def render_docx(title, content):
+    """
+    Renders markdown text content as a .docx file in a single pass over its lines.
+    Supports headings, bulleted (nested) and numbered lists, bold/italic/code spans, tables,
+    block quotes and fenced code.
+    """
+    from docx import Document
+
     doc = Document()
     doc.add_heading(title, level=1)
-    
-    for line in content.split('\n'):
-        if line.startswith('### '): doc.add_heading(line.replace('### ', ''), level=3)
-        elif line.startswith('## '): doc.add_heading(line.replace('## ', ''), level=2)
-        elif line.startswith('# '): doc.add_heading(line.replace('# ', ''), level=1)
-        elif line.startswith('* '): doc.add_paragraph(line.replace('* ', ''), style='List Bullet')
-        elif line.strip(): doc.add_paragraph(line)
+
+    table_rows = []
+    code_lines = None
+    for line in content.replace("\r\n", "\n").split("\n"):
+        match = _MD_BLOCK.match(line)
+        kind = match.lastgroup if match else None
+
+        if code_lines is not None:
+            if kind == "fence":
+                _add_code_block(doc, code_lines)
+                code_lines = None
+            else:
+                code_lines.append(line)
+            continue
+        if kind == "table":
+            if not _MD_TABLE_SEPARATOR.match(line):
+                table_rows.append(line)
+            continue
+        if table_rows:
+            _add_table(doc, table_rows)
+            table_rows = []
+
+        if kind == "fence":
+            code_lines = []
+        elif kind == "heading":
+            level = len(match.group("heading"))
+            _add_inline_runs(doc.add_heading(level=min(level, 9)), line[match.end():].strip())
+        elif kind == "bullet":
+            depth = min(len(match.group("bullet").expandtabs(4)) // 2, 2)
+            style = "List Bullet" if depth == 0 else f"List Bullet {depth + 1}"
+            _add_inline_runs(doc.add_paragraph(style=style), line[match.end():].strip())
+        elif kind == "number":
+            depth = min(len(match.group("number").expandtabs(4)) // 2, 2)
+            style = "List Number" if depth == 0 else f"List Number {depth + 1}"
+            _add_inline_runs(doc.add_paragraph(style=style), line[match.end():].strip())
+        elif kind == "quote":
+            _add_inline_runs(doc.add_paragraph(style="Quote"), line[match.end():].strip())
+        elif kind == "rule":
+            continue
+        elif line.strip():
+            _add_inline_runs(doc.add_paragraph(), line.strip())
+
+    if table_rows:
+        _add_table(doc, table_rows)
+    if code_lines is not None:
+        _add_code_block(doc, code_lines)
 
     buffer = io.BytesIO()
     doc.save(buffer)
     buffer.seek(0)
-    return buffer.getvalue()
\ No newline at end of file
+    return buffer.getvalue()
+
+@tracing.traced("generate_docx")
+@st.cache_data(max_entries=32, show_spinner=False)
+def generate_docx(title, content):
+    """Generates a .docx file from markdown content, cached by title and content so reruns are free."""
+    return render_docx(title, content)
@@ -0,0 +1,37 @@
+import importlib
+import threading
+import time
+
+# Imported on first use by the modules that need them; preloading them moves that cost off the user's path.
+HEAVY_MODULES = ["pandas", "requests", "jose.jwt", "google.generativeai", "docx"]
+
+_import_seconds = {}
+_started = False
+_started_lock = threading.Lock()
+
+def _preload(modules):
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        _import_seconds[name] = time.perf_counter() - started
+
+def start_warmup(modules=HEAVY_MODULES):
+    """
+    Imports the heavy dependencies on a background thread, once per process.
+    Call it after the first page has rendered so cold starts are not slowed down by it.
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return None
+        _started = True
+    thread = threading.Thread(target=_preload, args=(list(modules),), name="import-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def get_import_times():
+    """Returns how long each preloaded module took to import, in seconds."""
+    return dict(_import_seconds)